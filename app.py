@@ -1,246 +1,2346 @@
 import os
 import re
+import json
+import queue
 import uuid
+import time
+import random
+import hashlib
 import logging
-from flask import Flask, Response, request, render_template, redirect, url_for, session, jsonify
+import zlib
+import base64
+import difflib
+import unicodedata
+import zipfile
+import sqlite3
+import resource
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Blueprint, Response, request, render_template, redirect, url_for, session, jsonify, g, has_request_context
 from functools import wraps
+from contextlib import contextmanager
 import subprocess
 import tempfile
+import importlib.util
 import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from PyPDF2 import PdfMerger
+# reportlab, PyPDF2, numpy and google.generativeai are imported on first use to keep cold start fast
 
 # ✅ Logging configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# ✅ Create Flask app
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Needed for session management
+# ✅ Routes live on a blueprint; create_app() (bottom of file) builds the Flask app
+bp = Blueprint("resume", __name__)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ✅ Static passcode (change later if needed)
 PASSCODE = "aman"
 
-# ✅ Try importing Gemini
-try:
-    import google.generativeai as genai
-    HAS_GENAI = True
-    print("✅ google.generativeai imported successfully")
-except ImportError:
-    HAS_GENAI = False
+# ✅ Check for Gemini without importing it (the import itself happens on first use)
+def _module_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        return False
+
+HAS_GENAI = _module_available("google.generativeai")
+if HAS_GENAI:
+    print("✅ google.generativeai available")
+else:
     print("❌ google.generativeai not found — using fallback or mock")
 
+_genai_module = None
+
+def load_genai():
+    global _genai_module
+    if _genai_module is None:
+        import google.generativeai
+        _genai_module = google.generativeai
+    return _genai_module
+
 # ✅ Set API key from env (or leave empty, user can enter it manually)
 DEFAULT_GENAI_API_KEY = os.environ.get("GENAI_API_KEY", "")
 
-# ✅ Configure Gemini model
-if HAS_GENAI and DEFAULT_GENAI_API_KEY:
-    genai.configure(api_key=DEFAULT_GENAI_API_KEY)
-    default_model = genai.GenerativeModel("gemini-1.5-flash")
-else:
-    default_model = None
+def _env_int(name, default):
+    value = os.environ.get(name, "")
+    return int(value) if value.strip() else default
+
+def _env_float(name, default):
+    value = os.environ.get(name, "")
+    return float(value) if value.strip() else default
+
+# ✅ Metrics registry (Prometheus text format) + per-stage timing spans
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TIMING_HEADER = os.environ.get("METRICS_TIMING_HEADER", "").lower() in ("1", "true", "yes")
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._help = {}
+        self._collectors = []  # callables yielding (name, kind, help, labels, value)
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, help="", **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, help="", **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            item = self._histograms.get(key)
+            if item is None:
+                item = self._histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    item[i] += 1
+            item[-2] += value
+            item[-1] += 1
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    @staticmethod
+    def _escape(value, quote=True):
+        # Prometheus text format: backslash, newline (and '"' inside label values) must be escaped
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+        return value.replace('"', '\\"') if quote else value
+
+    @classmethod
+    def _format_labels(cls, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{cls._escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            helps = dict(self._help)
+
+        seen = set()
+        def header(name, kind, help):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._escape(help or name, quote=False)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter", helps[name][1])
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), item in sorted(histograms.items()):
+            header(name, "histogram", helps[name][1])
+            for bound, count in zip(LATENCY_BUCKETS, item):
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {item[-1]}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {round(item[-2], 6)}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {item[-1]}")
+        for collector in self._collectors:
+            try:
+                for name, kind, help, labels, value in collector():
+                    header(name, kind, help)
+                    lines.append(f"{name}{self._format_labels(self._labels(labels))} {value}")
+            except Exception as e:
+                logging.warning(f"⚠️ Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
 
-# ✅ Load helper files (prompts + LaTeX)
-def load_file(path):
+@contextmanager
+def stage_timer(stage):
+    started = time.perf_counter()
     try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("resume_stage_seconds", elapsed, help="Time spent per processing stage", stage=stage)
+        if has_request_context():
+            g.setdefault("stage_timings", []).append((stage, elapsed))
+
+# ✅ Per-API-key Gemini client pool
+# Each key gets its own GenerativeModel bound to its own service client, so no
+# request ever touches the process-global genai.configure() state. The
+# underlying gRPC clients are thread-safe and shared by all request threads.
+class GeminiClientPool:
+    def __init__(self, model_name="gemini-1.5-flash", max_clients=64, idle_ttl=1800, pinned_keys=()):
+        self.model_name = model_name
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self._pinned = {self._key(k) for k in pinned_keys if k}
+        self._clients = OrderedDict()  # key hash -> [model, last_used]
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _key(api_key):
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def get(self, api_key):
+        key = self._key(api_key)
+        with self._lock:
+            self._evict_idle()
+            item = self._clients.get(key)
+            if item is not None:
+                item[1] = time.time()
+                self._clients.move_to_end(key)
+                self.reused += 1
+                return item[0]
+
+            model = self._create(api_key)
+            model._rate_key = key[:16]  # 🔑 Rate limiter / circuit breaker bucket for this key
+            self._clients[key] = [model, time.time()]
+            self.created += 1
+            self._evict_overflow()
+            return model
+
+    def _create(self, api_key):
+        from google.ai import generativelanguage as glm
+        model = load_genai().GenerativeModel(self.model_name)
+        # Bind a dedicated client instead of the lazily-created global default
+        model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        return model
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.idle_ttl
+        for key in [k for k, (_, last_used) in self._clients.items()
+                    if last_used < cutoff and k not in self._pinned]:
+            del self._clients[key]
+            self.evicted += 1
+
+    def _evict_overflow(self):
+        for key in list(self._clients):
+            if len(self._clients) <= self.max_clients:
+                break
+            if key not in self._pinned:
+                del self._clients[key]
+                self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._clients),
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+gemini_pool = GeminiClientPool(
+    max_clients=_env_int("GEMINI_POOL_MAX_CLIENTS", 64),
+    idle_ttl=_env_int("GEMINI_POOL_IDLE_TTL", 1800),
+    pinned_keys=[DEFAULT_GENAI_API_KEY],
+)
+
+# ✅ Configure Gemini model (created on first use)
+default_model = None
+
+def get_default_model():
+    global default_model
+    if default_model is None and HAS_GENAI and DEFAULT_GENAI_API_KEY:
+        default_model = gemini_pool.get(DEFAULT_GENAI_API_KEY)
+    return default_model
+
+def model_for_key(api_key):
+    if HAS_GENAI and api_key:
+        return gemini_pool.get(api_key)
+    return get_default_model()
+
+# ✅ Template/prompt registry: preloaded + validated, hot-reloaded when a file's mtime changes
+TEMPLATE_RELOAD_INTERVAL = _env_float("TEMPLATE_RELOAD_INTERVAL", 2)  # 0 = never reload
+TEMPLATE_STRICT = os.environ.get("TEMPLATE_STRICT", "").lower() in ("1", "true", "yes")
+PROMPT_DIR = os.environ.get("PROMPT_DIR", "")
+
+class TemplateRegistry:
+    def __init__(self, base_dir, reload_interval):
+        self.base_dir = base_dir
+        self.reload_interval = reload_interval
+        self._specs = {}      # name -> (candidate paths, required placeholders)
+        self._entries = {}    # name -> {"path", "mtime", "text"}
+        self._overrides = {}  # name -> text pinned in code (benchmarks, experiments)
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self.errors = {}
+        self.reloads = 0
+
+    def register(self, name, filename, subdir, markers=()):
+        # templates/ and prompts/ first, then the repo root (flat checkouts)
+        paths = [os.path.join(subdir, filename), filename]
+        if PROMPT_DIR:
+            paths.insert(0, os.path.join(PROMPT_DIR, filename))
+        self._specs[name] = (paths, tuple(markers))
+
+    def _resolve(self, paths):
+        for path in paths:
+            full = os.path.join(self.base_dir, path)  # absolute paths pass through join unchanged
+            if os.path.isfile(full):
+                return full
+        raise FileNotFoundError(f"none of {', '.join(paths)} found")
+
+    def _load(self, name):
+        paths, markers = self._specs[name]
+        path = self._resolve(paths)
+        mtime = os.stat(path).st_mtime_ns
         with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-    except Exception as e:
-        logging.error(f"❌ Error loading file {path}: {e}")
-        return ""
+            text = f.read()
+        missing = [m for m in markers if m not in text]
+        if missing:
+            raise ValueError(f"{path} is missing {', '.join(missing)}")
+        return {"path": path, "mtime": mtime, "text": text}
+
+    def load_all(self, strict=False):
+        for name in self._specs:
+            try:
+                entry = self._load(name)
+            except (OSError, ValueError) as e:
+                self.errors[name] = str(e)
+                logging.error(f"❌ Template {name} not loaded: {e}")
+                continue
+            with self._lock:
+                self._entries[name] = entry
+            self.errors.pop(name, None)
+        if strict and self.errors:
+            raise RuntimeError("Templates failed validation: " + "; ".join(f"{k}: {v}" for k, v in self.errors.items()))
+
+    def _maybe_reload(self):
+        # 🔄 At most one round of stat() calls per interval, whatever the request rate
+        now = time.monotonic()
+        with self._lock:
+            if not self.reload_interval or now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+        for name, (paths, _) in self._specs.items():
+            entry = self._entries.get(name)
+            try:
+                path = self._resolve(paths)
+                if entry and path == entry["path"] and os.stat(path).st_mtime_ns == entry["mtime"]:
+                    continue
+                fresh = self._load(name)
+            except (OSError, ValueError) as e:
+                if self.errors.get(name) != str(e):
+                    logging.warning(f"⚠️ Template {name} not reloaded, keeping the previous version: {e}")
+                self.errors[name] = str(e)
+                continue
+            with self._lock:
+                self._entries[name] = fresh
+                self.reloads += 1
+            self.errors.pop(name, None)
+            logging.info(f"🔄 Reloaded template {name} from {fresh['path']}")
+
+    def get(self, name):
+        if name in self._overrides:
+            return self._overrides[name]
+        self._maybe_reload()
+        entry = self._entries.get(name)
+        return entry["text"] if entry else ""
+
+    def override(self, name, text):
+        if text is None:
+            self._overrides.pop(name, None)
+        else:
+            self._overrides[name] = text
 
-# Load template + prompts
-LATEX_TEMPLATE = load_file("templates/latex_template.tex")
-PROMPT_FORMATTER = load_file("prompts/resume_formatter.txt")
-PROMPT_EVALUATOR = load_file("prompts/resume_evaluator.txt")
-PROMPT_OPTIMIZER = load_file("prompts/resume_optimizer.txt")
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": {name: os.path.relpath(entry["path"], self.base_dir) for name, entry in self._entries.items()},
+                "errors": dict(self.errors),
+                "overrides": sorted(self._overrides),
+                "reloads": self.reloads,
+            }
 
-# ✅ In-memory resume store (cache by resume_id)
-resume_store = {}
+templates = TemplateRegistry(BASE_DIR, TEMPLATE_RELOAD_INTERVAL)
+templates.register("latex_template", "latex_template.tex", "templates", ["\\documentclass", "\\begin{document}"])
+templates.register("formatter", "resume_formatter.txt", "prompts", ["<RESUME_TEXT>", "<LATEX_TEMPLATE>"])
+templates.register("evaluator", "resume_evaluator.txt", "prompts", ["<LATEX_CODE>", "<JOB_DESCRIPTION>"])
+templates.register("optimizer", "resume_optimizer.txt", "prompts", ["<LATEX_CODE>", "<JOB_DESCRIPTION>", "<FEEDBACK>"])
+templates.register("section_optimizer", "resume_section_optimizer.txt", "prompts",
+                   ["<SECTIONS>", "<JOB_DESCRIPTION>", "<FEEDBACK>"])
+templates.register("fused_analyzer", "resume_analyzer_json.txt", "prompts", ["<LATEX_CODE>", "<JOB_DESCRIPTION>"])
+
+
+# ✅ Content-addressed cache (LRU in memory + optional on-disk tier)
+class ContentCache:
+    def __init__(self, name, max_entries=256, max_bytes=None, ttl=None, disk_dir=None, disk_max_bytes=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if not self._expired(item[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                self._remove(key)
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, value, time.time())
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._insert(key, value, time.time())
+        self._disk_set(key, value)
+
+    def _insert(self, key, value, stored_at):
+        if key in self._entries:
+            self._remove(key)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return  # too large to keep in memory
+        self._entries[key] = (stored_at, value)
+        self._bytes += len(value)
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            old_key = next(iter(self._entries))
+            self._remove(old_key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)  # refresh LRU position on disk
+            return value
+        except OSError:
+            return None
+
+    def _disk_set(self, key, value):
+        if not self.disk_dir:
+            return
+        try:
+            tmp_path = f"{self._disk_path(key)}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, self._disk_path(key))
+            self._prune_disk()
+        except OSError as e:
+            logging.warning(f"⚠️ {self.name} cache disk write failed: {e}")
+
+    def _prune_disk(self):
+        if not self.disk_max_bytes:
+            return
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_enabled": bool(self.disk_dir),
+            }
+
+# ✅ Gemini response cache, keyed by model name + hash of the fully built prompt
+llm_cache = ContentCache(
+    "llm",
+    max_entries=_env_int("LLM_CACHE_MAX_ENTRIES", 512),
+    max_bytes=_env_int("LLM_CACHE_MAX_BYTES", 32 * 1024 * 1024),
+    ttl=_env_int("LLM_CACHE_TTL", 24 * 3600) or None,
+    disk_dir=os.environ.get("LLM_CACHE_DIR") or None,
+    disk_max_bytes=_env_int("LLM_CACHE_DISK_MAX_BYTES", 128 * 1024 * 1024),
+)
+
+# ✅ Compiled resume PDFs, keyed by a hash of the LaTeX source
+pdf_cache = ContentCache(
+    "pdf",
+    max_entries=_env_int("PDF_CACHE_MAX_ENTRIES", 128),
+    max_bytes=_env_int("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+    ttl=_env_int("PDF_CACHE_TTL", 0) or None,
+    disk_dir=os.environ.get("PDF_CACHE_DIR") or None,
+    disk_max_bytes=_env_int("PDF_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024),
+)
+
+# ✅ Final downloads (summary page + resume), keyed by a hash of the resume version
+final_pdf_cache = ContentCache(
+    "final_pdf",
+    max_entries=_env_int("FINAL_PDF_CACHE_MAX_ENTRIES", 64),
+    max_bytes=_env_int("FINAL_PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+    ttl=_env_int("FINAL_PDF_CACHE_TTL", 0) or None,
+    disk_dir=os.environ.get("FINAL_PDF_CACHE_DIR") or None,
+    disk_max_bytes=_env_int("FINAL_PDF_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024),
+)
+PDF_STREAM_CHUNK = _env_int("PDF_STREAM_CHUNK", 64 * 1024)
+
+class CachedResponse:
+    def __init__(self, text, prompt_tokens=0, response_tokens=0, cached=False):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        self.cached = cached
+
+def estimate_tokens(text):
+    # Gemini averages roughly four characters per token for English prose/LaTeX
+    return (len(text) + 3) // 4
+
+def _usage_counts(response, prompt, text):
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt)
+    response_tokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(text)
+    return prompt_tokens, response_tokens
+
+# 🧮 Per-thread LLM usage tracking (e.g. tokens spent by one optimization iteration)
+_usage_local = threading.local()
+
+class LLMUsage:
+    def __init__(self):
+        self.calls = 0
+        self.cached_calls = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.response_tokens
+
+    def add(self, response):
+        self.calls += 1
+        if response.cached:
+            self.cached_calls += 1
+        else:
+            self.prompt_tokens += response.prompt_tokens
+            self.response_tokens += response.response_tokens
+
+@contextmanager
+def track_llm_usage():
+    usage = LLMUsage()
+    trackers = getattr(_usage_local, "trackers", None)
+    if trackers is None:
+        trackers = _usage_local.trackers = []
+    trackers.append(usage)
+    try:
+        yield usage
+    finally:
+        trackers.remove(usage)
+
+def _record_usage(response):
+    for usage in getattr(_usage_local, "trackers", ()):
+        usage.add(response)
+    return response
+
+def llm_cache_key(model, prompt, generation_config=None):
+    model_name = getattr(model, "model_name", None) or type(model).__name__
+    if generation_config:
+        model_name += json.dumps(generation_config, sort_keys=True)
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model_name}\0{digest}".encode("utf-8")).hexdigest()
+
+# ✅ Resilient Gemini call layer: per-key rate limit, timeout, retry, hedging, circuit breaker
+LLM_TIMEOUT = _env_float("LLM_TIMEOUT", 90)
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 2)
+LLM_BACKOFF_BASE = _env_float("LLM_BACKOFF_BASE", 0.5)
+LLM_BACKOFF_MAX = _env_float("LLM_BACKOFF_MAX", 8)
+LLM_HEDGE_AFTER = _env_float("LLM_HEDGE_AFTER", 0)  # 0 = no hedged requests
+LLM_RATE_PER_MINUTE = _env_float("LLM_RATE_PER_MINUTE", 60)  # 0 = unlimited
+LLM_RATE_BURST = _env_int("LLM_RATE_BURST", 10)
+LLM_RATE_MAX_WAIT = _env_float("LLM_RATE_MAX_WAIT", 30)
+CIRCUIT_FAILURE_THRESHOLD = _env_int("CIRCUIT_FAILURE_THRESHOLD", 5)
+CIRCUIT_RESET_TIMEOUT = _env_float("CIRCUIT_RESET_TIMEOUT", 30)
+
+RETRYABLE_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                         "InternalServerError", "GatewayTimeout", "TimeoutError", "ConnectionError"}
+RETRYABLE_ERROR_MARKERS = ("429", "500", "503", "504", "resource has been exhausted", "unavailable",
+                           "deadline exceeded", "timed out", "try again")
+
+class GeminiUnavailable(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate_per_second, burst):
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait):
+        # ⏳ Wait for a token, but never longer than max_wait; returns False if it would take longer
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait > max_wait:
+                self.tokens += 1
+                return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True  # 🩺 Let exactly one trial call through
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logging.warning(f"🔌 Gemini circuit opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+class GeminiCallGuard:
+    BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, rate_per_minute, burst, max_wait, failure_threshold, reset_timeout, max_keys=256):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_wait = max_wait
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> TokenBucket
+        self._breakers = OrderedDict()  # key -> CircuitBreaker
+        self._lock = threading.Lock()
+        self.rate_limited = 0
+        self.breaker_rejections = 0
+
+    def _get(self, table, key, factory):
+        with self._lock:
+            item = table.get(key)
+            if item is None:
+                item = table[key] = factory()
+                while len(table) > self.max_keys:
+                    table.popitem(last=False)
+            table.move_to_end(key)
+            return item
+
+    def bucket(self, key):
+        if not self.rate_per_minute:
+            return None
+        return self._get(self._buckets, key, lambda: TokenBucket(self.rate_per_minute / 60.0, self.burst))
+
+    def breaker(self, key):
+        return self._get(self._breakers, key, lambda: CircuitBreaker(self.failure_threshold, self.reset_timeout))
+
+    def admit(self, key):
+        breaker = self.breaker(key)
+        if not breaker.allow():
+            with self._lock:
+                self.breaker_rejections += 1
+            metrics.inc("resume_llm_breaker_rejections_total", help="Calls failed fast by an open circuit")
+            raise GeminiUnavailable("Gemini is temporarily unavailable, please retry shortly.",
+                                    retry_after=breaker.retry_after())
+        bucket = self.bucket(key)
+        if bucket is not None and not bucket.acquire(self.max_wait):
+            with self._lock:
+                self.rate_limited += 1
+            metrics.inc("resume_llm_rate_limited_total", help="Calls rejected by the per-key rate limiter")
+            breaker.release_probe()
+            raise GeminiUnavailable("Gemini rate limit reached for this API key, please retry shortly.",
+                                    retry_after=int(self.max_wait) or 1)
+        return breaker
+
+    def breaker_states(self):
+        with self._lock:
+            return {key: self.BREAKER_STATES[b.state] for key, b in self._breakers.items()}
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+            return {
+                "keys": len(self._breakers),
+                "rate_limited": self.rate_limited,
+                "breaker_rejections": self.breaker_rejections,
+                "breakers_open": sum(1 for b in breakers if b.state == "open"),
+                "breakers_half_open": sum(1 for b in breakers if b.state == "half_open"),
+            }
+
+gemini_guard = GeminiCallGuard(
+    rate_per_minute=LLM_RATE_PER_MINUTE,
+    burst=LLM_RATE_BURST,
+    max_wait=LLM_RATE_MAX_WAIT,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_TIMEOUT,
+)
+# Gemini calls run here so a hung request can be abandoned at LLM_TIMEOUT. A call must hold one of
+# LLM_CALL_THREADS slots before it is submitted, so nothing ever waits in the executor queue.
+LLM_CALL_THREADS = _env_int("LLM_CALL_THREADS", 32)
+LLM_SLOT_WAIT = _env_float("LLM_SLOT_WAIT", LLM_TIMEOUT)
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_CALL_THREADS, thread_name_prefix="gemini")
+_llm_slots = threading.BoundedSemaphore(LLM_CALL_THREADS)
+
+def _llm_saturated():
+    metrics.inc("resume_llm_saturated_total", help="Gemini calls rejected because every call slot was busy")
+    return GeminiUnavailable("Gemini call capacity is saturated, please retry shortly.",
+                             retry_after=max(1, int(LLM_SLOT_WAIT)))
+
+def _submit_llm(fn, *args, **kwargs):
+    # 🎟️ The caller already holds a slot; it is freed when the call finishes or is cancelled unstarted
+    started = threading.Event()
+
+    def run():
+        started.set()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _llm_slots.release()
+
+    def release_if_cancelled(future):
+        if future.cancelled():
+            _llm_slots.release()
+
+    future = _llm_executor.submit(run)
+    future.add_done_callback(release_if_cancelled)
+    return future, started
+
+def _sdk_timeout(extra, timeout):
+    # ⏱️ Hand the deadline to the SDK too, so an abandoned call really ends and frees its thread + slot
+    return dict(extra, request_options={"timeout": max(0.1, timeout)})
+
+def _start_llm(fn, *args, **kwargs):
+    # ⏳ Wait up to LLM_SLOT_WAIT for a free slot; saturation is local, so it is not a Gemini failure
+    if not _llm_slots.acquire(timeout=LLM_SLOT_WAIT):
+        raise _llm_saturated()
+    future, started = _submit_llm(fn, *args, **kwargs)
+    if not started.wait(LLM_SLOT_WAIT):
+        future.cancel()
+        raise _llm_saturated()
+    return future
+
+def is_retryable_error(error):
+    if isinstance(error, GeminiUnavailable):
+        return False
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_ERROR_MARKERS)
+
+def backoff_delay(attempt):
+    # 🎲 Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+def _call_once(model, prompt, extra, call):
+    primary = _start_llm(model.generate_content, prompt, **_sdk_timeout(extra, LLM_TIMEOUT))
+    # ⏱️ The timeout runs from when Gemini is actually being called, not from when a slot was requested
+    deadline = time.monotonic() + LLM_TIMEOUT
+    pending = {primary}
+    if LLM_HEDGE_AFTER and LLM_HEDGE_AFTER < LLM_TIMEOUT:
+        done, _ = wait_futures(pending, timeout=LLM_HEDGE_AFTER)
+        # Only hedge with a spare slot; a hedge that has to queue can't beat the primary
+        if not done and _llm_slots.acquire(blocking=False):
+            bucket = gemini_guard.bucket(getattr(model, "_rate_key", "default"))
+            if bucket is None or bucket.try_acquire():
+                # 🏇 Slow tail call: race a second identical request, first answer wins
+                metrics.inc("resume_llm_hedges_total", help="Hedged second requests launched", call=call)
+                pending.add(_submit_llm(model.generate_content, prompt,
+                                        **_sdk_timeout(extra, deadline - time.monotonic()))[0])
+            else:
+                _llm_slots.release()
+
+    error = None
+    try:
+        while pending:
+            done, pending = wait_futures(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                         return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        metrics.inc("resume_llm_hedge_wins_total", help="Hedged requests that answered first",
+                                    call=call)
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise TimeoutError(f"Gemini call timed out after {LLM_TIMEOUT:g}s")
+    finally:
+        # 🧹 Cancel the losing hedge / anything not yet started; calls already running finish on their own
+        for future in pending:
+            future.cancel()
+
+def _stream_once(model, prompt, extra, on_token):
+    # 📡 Pump the stream on a worker so every chunk wait is bounded by the overall deadline
+    chunks = queue.Queue()
+    abandoned = threading.Event()
+
+    def pump():
+        try:
+            for piece in model.generate_content(prompt, stream=True, **_sdk_timeout(extra, LLM_TIMEOUT)):
+                if abandoned.is_set():
+                    return  # the caller timed out; stop reading and free the slot
+                chunks.put(("chunk", piece))
+            chunks.put(("end", None))
+        except Exception as e:
+            chunks.put(("error", e))
+
+    _start_llm(pump)
+    deadline = time.monotonic() + LLM_TIMEOUT
+    parts, response, emitted = [], None, False
+    while True:
+        try:
+            kind, item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            abandoned.set()
+            error = TimeoutError(f"Gemini stream timed out after {LLM_TIMEOUT:g}s")
+            error.tokens_emitted = emitted
+            raise error from None
+        if kind == "end":
+            return response, "".join(parts)
+        if kind == "error":
+            item.tokens_emitted = emitted
+            raise item
+        response = item
+        piece = getattr(item, "text", "")
+        if piece:
+            parts.append(piece)
+            emitted = True
+            on_token(piece)
+
+def guarded_generate(model, prompt, extra, on_token=None, call="llm"):
+    key = getattr(model, "_rate_key", "default")
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        breaker = gemini_guard.admit(key)
+        try:
+            if on_token:
+                result = _stream_once(model, prompt, extra, on_token)
+            else:
+                response = _call_once(model, prompt, extra, call)
+                result = (response, response.text if response else "")
+        except Exception as e:
+            retryable = is_retryable_error(e)
+            if isinstance(e, GeminiUnavailable):
+                breaker.release_probe()  # our own call slots were full; says nothing about Gemini
+            elif retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_success()  # the backend answered; the request itself was bad
+            # Tokens already streamed to the client can't be taken back
+            if not retryable or attempt == LLM_MAX_RETRIES or getattr(e, "tokens_emitted", False):
+                metrics.inc("resume_llm_failures_total", help="Gemini calls that failed after retries",
+                            call=call, error=type(e).__name__)
+                raise
+            delay = backoff_delay(attempt)
+            metrics.inc("resume_llm_retries_total", help="Gemini call retries", call=call)
+            logging.warning(f"🔁 Gemini {call} call failed ({e}); retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+# ✅ Single entry point for every Gemini call (cached, optionally streamed)
+def generate_content(model, prompt, use_cache=True, on_token=None, generation_config=None, call="llm"):
+    started = time.perf_counter()
+    key = llm_cache_key(model, prompt, generation_config)
+    extra = {"generation_config": generation_config} if generation_config else {}
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            logging.info("♻️ Gemini response served from cache")
+            text = cached.decode("utf-8")
+            if on_token:
+                on_token(text)
+            return _record_llm_call(call, prompt, CachedResponse(text, cached=True), started)
+
+    # 📡 Tokens are passed through to on_token as Gemini streams them
+    response, text = guarded_generate(model, prompt, extra, on_token=on_token, call=call)
+    if text:
+        llm_cache.set(key, text.encode("utf-8"))
+    prompt_tokens, response_tokens = _usage_counts(response, prompt, text)
+    return _record_llm_call(call, prompt, CachedResponse(text, prompt_tokens, response_tokens), started)
+
+def _record_llm_call(call, prompt, response, started):
+    elapsed = time.perf_counter() - started
+    cached = "true" if response.cached else "false"
+    metrics.observe("resume_llm_call_seconds", elapsed, help="Gemini call latency", call=call, cached=cached)
+    metrics.inc("resume_llm_prompt_chars_total", len(prompt), help="Prompt characters sent", call=call)
+    metrics.inc("resume_llm_response_chars_total", len(response.text or ""), help="Response characters received", call=call)
+    if not response.cached:
+        metrics.inc("resume_llm_prompt_tokens_total", response.prompt_tokens, help="Prompt tokens billed", call=call)
+        metrics.inc("resume_llm_response_tokens_total", response.response_tokens, help="Response tokens billed", call=call)
+    if has_request_context():
+        g.setdefault("stage_timings", []).append((f"llm_{call}", elapsed))
+    return _record_usage(response)
+
+# ✅ Resume session store (pluggable backends: memory / sqlite / file)
+# Entries are JSON-serialized so every backend has the same copy-on-read
+# semantics: mutate the dict you got, then write it back with store[key] = entry.
+class ResumeStore:
+    backend = "base"
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    @staticmethod
+    def _encode(value):
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def _decode(raw):
+        return json.loads(raw.decode("utf-8") if isinstance(raw, bytes) else raw)
+
+class MemoryResumeStore(ResumeStore):
+    backend = "memory"
+
+    def __init__(self, namespace, max_entries=1000, max_bytes=None, ttl=None):
+        self._cache = ContentCache(f"store:{namespace}", max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+    def get(self, key):
+        raw = self._cache.get(key)
+        return None if raw is None else self._decode(raw)
+
+    def put(self, key, value):
+        self._cache.set(key, self._encode(value))
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def stats(self):
+        cache_stats = self._cache.stats()
+        return {
+            "backend": self.backend,
+            "entries": cache_stats["entries"],
+            "bytes": cache_stats["bytes"],
+            "evictions": cache_stats["evictions"],
+        }
+
+class SQLiteResumeStore(ResumeStore):
+    backend = "sqlite"
+
+    def __init__(self, namespace, path, max_entries=None, ttl=None):
+        self.path = path
+        self.table = re.sub(r"\W", "_", namespace)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self.evictions = 0
+        self._conn().execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn().execute(f"CREATE INDEX IF NOT EXISTS {self.table}_updated ON {self.table} (updated_at)")
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(f"SELECT value, updated_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and time.time() - row[1] > self.ttl:
+            self.delete(key)
+            return None
+        return self._decode(row[0])
+
+    def put(self, key, value):
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+            (key, self._encode(value), time.time())
+        )
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._evict()
+
+    def delete(self, key):
+        self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _evict(self):
+        conn = self._conn()
+        if self.ttl is not None:
+            self.evictions += conn.execute(f"DELETE FROM {self.table} WHERE updated_at < ?",
+                                           (time.time() - self.ttl,)).rowcount
+        if self.max_entries:
+            self.evictions += conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                "ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            ).rowcount
+
+    def stats(self):
+        entries, total = self._conn().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM {self.table}"
+        ).fetchone()
+        return {"backend": self.backend, "entries": entries, "bytes": total, "evictions": self.evictions}
+
+class FileResumeStore(ResumeStore):
+    backend = "file"
+
+    def __init__(self, namespace, directory, max_entries=None, ttl=None):
+        self.directory = os.path.join(directory, namespace)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._writes = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        # Hash keys so arbitrary IDs can never escape the store directory
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                self.delete(key)
+                return None
+            with open(path, "rb") as f:
+                return self._decode(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._encode(value))
+        os.replace(tmp_path, path)  # atomic, safe across processes
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        # 🧹 Same policy as the sqlite backend: drop expired entries, then the oldest beyond max_entries
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue  # removed by another worker meanwhile
+        files.sort(reverse=True)
+        cutoff = time.time() - self.ttl if self.ttl is not None else None
+        for index, (mtime, path) in enumerate(files):
+            if (cutoff is not None and mtime < cutoff) or (self.max_entries and index >= self.max_entries):
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except OSError:
+                    pass
+
+    def stats(self):
+        entries = total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                entries += 1
+                total += entry.stat().st_size
+        return {"backend": self.backend, "entries": entries, "bytes": total, "evictions": self.evictions}
+
+RESUME_STORE_BACKEND = os.environ.get("RESUME_STORE_BACKEND", "memory").lower()
+RESUME_STORE_PATH = os.environ.get("RESUME_STORE_PATH", "")
+
+def create_store(namespace):
+    ttl = _env_int("RESUME_STORE_TTL", 7 * 24 * 3600) or None
+    max_entries = _env_int("RESUME_STORE_MAX_ENTRIES", 1000)
+    if RESUME_STORE_BACKEND == "sqlite":
+        return SQLiteResumeStore(namespace, RESUME_STORE_PATH or "resume_store.sqlite3",
+                                 max_entries=max_entries, ttl=ttl)
+    if RESUME_STORE_BACKEND == "file":
+        return FileResumeStore(namespace, RESUME_STORE_PATH or "resume_store", max_entries=max_entries, ttl=ttl)
+    if RESUME_STORE_BACKEND != "memory":
+        logging.warning(f"⚠️ Unknown RESUME_STORE_BACKEND {RESUME_STORE_BACKEND!r}, using memory")
+    return MemoryResumeStore(namespace, max_entries=max_entries,
+                             max_bytes=_env_int("RESUME_STORE_MAX_BYTES", 256 * 1024 * 1024), ttl=ttl)
+
+# ✅ Resume session store (cache by resume_id)
+resume_store = create_store("resumes")
+
+# 🔑 User Gemini API keys never go into the (possibly on-disk) resume store: they stay in this
+# process's memory only; a resume opened on another worker process falls back to the server key
+resume_api_keys = ContentCache("resume_api_keys", max_entries=_env_int("RESUME_STORE_MAX_ENTRIES", 1000),
+                               ttl=_env_int("RESUME_STORE_TTL", 7 * 24 * 3600) or None)
+
+def resume_api_key(resume_id):
+    raw = resume_api_keys.get(resume_id)
+    return raw.decode("utf-8") if raw is not None else None
 
 # ✅ Login required decorator
 def login_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         if not session.get("authenticated"):
-            return redirect(url_for("login"))
+            return redirect(url_for(".login"))
         return f(*args, **kwargs)
     return wrapper
 
 # ✅ Login route
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         if request.form.get("passcode") == PASSCODE:
             session["authenticated"] = True
-            return redirect(url_for("index"))
+            return redirect(url_for(".index"))
         return render_template("login.html", error="Invalid passcode")
     return render_template("login.html")
 
 # ✅ Logout route
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.pop("authenticated", None)
-    return redirect(url_for("login"))
+    return redirect(url_for(".login"))
 
 # ✅ Homepage route
-@app.route("/")
+@bp.route("/")
 @login_required
 def index():
     return render_template("index.html")
 
-# ✅ Route to generate resume
-@app.route("/generate_resume", methods=["POST"])
-@login_required
-def generate_resume():
-    try:
-        # 🌐 Get user input from the form
-        resume_text = request.form.get("resume_content", "").strip()
-        job_description = request.form.get("job_description", "").strip()
-        user_api_key = request.form.get("api_key", "").strip()
-        company_name = request.form.get("company_name", "").strip()
-
-        if not resume_text or not job_description:
-            return jsonify({"error": "Resume and Job Description are required."}), 400
+# ✅ LaTeX → plain-text reducer for scoring prompts (drops preamble + formatting macros)
+COMPACT_PROMPTS = os.environ.get("COMPACT_PROMPTS", "").lower() in ("1", "true", "yes")
+
+_LATEX_DROP_WITH_ARGS = (
+    "vspace", "hspace", "vskip", "hskip", "setlength", "addtolength", "pagenumbering", "titleformat",
+    "titlespacing", "setlist", "usepackage", "newcommand", "renewcommand", "label", "includegraphics",
+    "color", "fontsize", "definecolor", "geometry"
+)
+_latex_comment_re = re.compile(r"(?<!\\)%.*")
+_latex_drop_re = re.compile(r"\\(?:%s)\*?(?:\[[^\]]*\])?(?:\{[^{}]*\})*" % "|".join(_LATEX_DROP_WITH_ARGS))
+_latex_section_re = re.compile(r"\\(sub)?section\*?\{([^{}]*)\}")
+_latex_href_re = re.compile(r"\\href\{([^{}]*)\}\{([^{}]*)\}")
+_latex_url_re = re.compile(r"\\url\{([^{}]*)\}")
+_latex_env_re = re.compile(r"\\(?:begin|end)\{[^{}]*\}(?:\[[^\]]*\])?")
+_latex_item_re = re.compile(r"\\item(?:\[[^\]]*\])?\s*")
+_latex_escaped_re = re.compile(r"\\([&%$#_{}])")
+_latex_any_command_re = re.compile(r"\\[a-zA-Z@]+\*?(?:\[[^\]]*\])?")
+
+def latex_to_text(latex_code):
+    _, body = split_latex_preamble(latex_code)
+    body = body.replace("\\begin{document}", "").split("\\end{document}")[0]
+
+    text = _latex_comment_re.sub("", body)
+    text = _latex_drop_re.sub("", text)
+    text = _latex_section_re.sub(lambda m: f"\n\n{'###' if m.group(1) else '##'} {m.group(2)}\n", text)
+    text = _latex_href_re.sub(lambda m: m.group(2) if m.group(1) == m.group(2) else f"{m.group(2)} ({m.group(1)})", text)
+    text = _latex_url_re.sub(r"\1", text)
+    text = _latex_env_re.sub("\n", text)
+    text = _latex_item_re.sub("\n- ", text)
+    text = text.replace("\\\\", "\n").replace("~", " ")
+    text = _latex_escaped_re.sub(lambda m: "\0" + m.group(1), text)  # protect escaped specials
+    text = _latex_any_command_re.sub("", text)
+    text = text.replace("{", "").replace("}", "").replace("\0", "")
+
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"[ \t]+", " ", line).strip()
+        if line.startswith("#") and lines:
+            lines.append("")  # keep a blank line before each section heading
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+def resume_for_prompt(latex_resume, compact=None):
+    if compact is None:
+        compact = COMPACT_PROMPTS
+    return latex_to_text(latex_resume) if compact else latex_resume
+
+# 🧮 Prompt size per call type (full LaTeX vs what was actually sent)
+class PromptSizeStats:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def record(self, call, prompt, latex_full, latex_sent):
+        sent = estimate_tokens(prompt)
+        full = sent - estimate_tokens(latex_sent) + estimate_tokens(latex_full)
+        if sent != full:
+            logging.info(f"✂️ {call} prompt compacted: ~{full} → ~{sent} tokens")
+        with self._lock:
+            item = self._calls.setdefault(call, {"calls": 0, "full_tokens": 0, "sent_tokens": 0})
+            item["calls"] += 1
+            item["full_tokens"] += full
+            item["sent_tokens"] += sent
+
+    def stats(self):
+        with self._lock:
+            return {
+                call: dict(item, saved_pct=round(100.0 * (1 - item["sent_tokens"] / item["full_tokens"]), 1)
+                           if item["full_tokens"] else 0.0)
+                for call, item in self._calls.items()
+            }
 
-        # ⚙️ Configure Gemini based on provided API key
-        if HAS_GENAI:
-            try:
-                if user_api_key:
-                    genai.configure(api_key=user_api_key)
-                    model = genai.GenerativeModel("gemini-1.5-flash")
-                    logging.info("🔑 Using user-provided Gemini key")
-                else:
-                    model = default_model
-                    logging.info("🧠 Using default Gemini model")
-            except Exception as e:
-                logging.warning(f"❗ Failed to configure Gemini: {e}")
-                model = default_model
-        else:
-            model = None
+prompt_size_stats = PromptSizeStats()
+
+# ✅ Local ATS keyword pre-scorer (TF-IDF + keyword coverage, vectorized with NumPy)
+ATS_STOPWORDS = frozenset("""
+a about above across after all also an and any are as at be been being both but by can could
+do does etc for from has have having how if in including into is it its may more most must
+new not of on or other our over per plus should so such than that the their them then there
+these they this those through to under up us using via was we well were what when where which
+while who will with within work working would year years you your team strong ability
+experience experienced knowledge skills skill role responsibilities requirements required
+preferred candidate job position company looking join ideal need needs nice hiring seeking
+""".split())
+
+ATS_GATE_SKIP_ABOVE = float(os.environ.get("ATS_GATE_SKIP_ABOVE") or "inf")
+
+_latex_command_re = re.compile(r"\\[a-zA-Z@]+\*?(\[[^\]]*\])?")
+_ats_token_re = re.compile(r"[a-z][a-z0-9+#]*(?:[.\-][a-z0-9+#]+)*")
+
+def ats_terms(text):
+    text = _latex_command_re.sub(" ", text).lower()
+    words = [w for w in _ats_token_re.findall(text) if len(w) > 1 and w not in ATS_STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+# ✅ Job-description profiles: each distinct posting is analyzed once and shared by every session
+JD_PROFILE_VERSION = 1  # bump when extract_job_profile changes shape
+JD_PROFILE_KEY_PHRASES = _env_int("JD_PROFILE_KEY_PHRASES", 15)
+JD_PROFILE_LOCAL_ENTRIES = _env_int("JD_PROFILE_LOCAL_ENTRIES", 256)
+
+SENIORITY_LEVELS = (
+    ("manager", re.compile(r"\b(?:manager|head of|director|vp)\b", re.IGNORECASE)),
+    ("lead", re.compile(r"\b(?:lead|staff|principal)\b", re.IGNORECASE)),
+    ("senior", re.compile(r"\b(?:senior|sr\.?)(?=\W|$)", re.IGNORECASE)),
+    ("mid", re.compile(r"\b(?:mid[- ]?level|intermediate)\b", re.IGNORECASE)),
+    ("junior", re.compile(r"\b(?:junior|jr\.?|entry[- ]level|new grad|graduate)(?=\W|$)", re.IGNORECASE)),
+    ("intern", re.compile(r"\b(?:intern|internship|co-op)\b", re.IGNORECASE)),
+)
+_years_re = re.compile(r"\b(\d{1,2})\s*\+?\s*(?:-|to)?\s*(?:\d{1,2}\s*)?\+?\s*(?:years?|yrs?)\b", re.IGNORECASE)
+
+def detect_seniority(job_description):
+    years = [int(y) for y in _years_re.findall(job_description) if int(y) <= 30]
+    min_years = min(years) if years else None
+    # The title line decides; "lead" / "manager" in the body are usually verbs or reporting lines
+    title = next((line for line in job_description.splitlines() if line.strip()), "")
+    for level, pattern in SENIORITY_LEVELS:
+        if pattern.search(title):
+            return level, min_years
+    for level, pattern in SENIORITY_LEVELS[2:]:
+        if pattern.search(job_description):
+            return level, min_years
+    if min_years is None:
+        return "unspecified", None
+    return ("junior" if min_years < 2 else "mid" if min_years < 5 else "senior" if min_years < 8 else "lead"), min_years
+
+def key_phrases(vector, limit):
+    # Repeated bigrams first (they carry the posting's vocabulary), then unigrams they don't already cover
+    bigrams = sorted((t for t, c in vector.items() if " " in t and c > 1), key=lambda t: -vector[t])
+    unigrams = sorted((t for t in vector if " " not in t), key=lambda t: -vector[t])
+    phrases, covered = [], set()
+    for term in bigrams[:limit // 2] + unigrams:
+        if len(phrases) >= limit:
+            break
+        if term in covered:
+            continue
+        phrases.append(term)
+        covered.update(term.split())
+    return phrases
+
+def extract_job_profile(job_description):
+    vector = {}
+    for term in ats_terms(job_description):
+        vector[term] = vector.get(term, 0) + 1  # first-appearance order, like ats_prescore_batch's vocabulary
+    hits = skill_taxonomy.find(job_description)
+    level, min_years = detect_seniority(job_description)
+    return {
+        "version": JD_PROFILE_VERSION,
+        "taxonomy": skill_taxonomy.fingerprint(),
+        "seniority": level,
+        "min_years": min_years,
+        "required_skills": [[name, category] for name, (kind, category) in hits.items() if kind == "skill"],
+        "required_certifications": [name for name, (kind, _) in hits.items() if kind == "certification"],
+        "key_phrases": key_phrases(vector, JD_PROFILE_KEY_PHRASES),
+        "keyword_vector": vector,
+        "created_at": time.time(),
+    }
 
-        if not model:
-            return jsonify({"error": "Gemini model not available."}), 500
+# Profiles live in the shared session store (memory / sqlite / file). Decoding one costs about as much as
+# re-tokenizing the posting, so recently used ones are also kept decoded in-process; they never change
+class JobProfileStore:
+    def __init__(self, store, local_entries):
+        self._store = store
+        self._local = OrderedDict()
+        self.local_entries = local_entries
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> Event while the first request extracts it
+        self.local_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.waited = 0
+        self.extract_seconds = 0.0
+        self.saved_ms = 0.0  # extraction time that hits didn't have to spend
+
+    @staticmethod
+    def normalize(job_description):
+        # Same posting pasted with different spacing / unicode forms → same profile
+        return _whitespace_re.sub(" ", unicodedata.normalize("NFKC", job_description or "")).strip()
+
+    def key(self, job_description):
+        digest = hashlib.sha256(f"v{JD_PROFILE_VERSION}:{skill_taxonomy.fingerprint()}\0".encode("utf-8"))
+        digest.update(self.normalize(job_description).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _count(self, result):
+        metrics.inc("resume_jd_profile_lookups_total", help="Job-description profile lookups", result=result)
+
+    def _remember(self, key, profile):
+        profile["id"] = key
+        with self._lock:
+            self._local[key] = profile
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_entries:
+                self._local.popitem(last=False)
+        return profile
+
+    # Returned profiles are shared between requests — read them, don't modify them
+    def get(self, job_description):
+        key = self.key(job_description)
+        with self._lock:
+            profile = self._local.get(key)
+            if profile is not None:
+                self._local.move_to_end(key)
+                self.hits += 1
+                self.local_hits += 1
+                self.saved_ms += profile.get("extract_ms", 0.0)
+        if profile is not None:
+            self._count("hit")
+            return profile
+
+        profile = self._store.get(key)
+        if profile is None:
+            with self._lock:
+                pending = self._pending.get(key)
+                leader = pending is None
+                if leader:
+                    self._pending[key] = threading.Event()
+            if not leader:
+                # 🤝 Someone is extracting this posting right now — reuse their result
+                pending.wait()
+                profile = self._store.get(key)
+                with self._lock:
+                    self.waited += 1
+        if profile is not None:
+            with self._lock:
+                self.hits += 1
+                self.saved_ms += profile.get("extract_ms", 0.0)
+            self._count("hit")
+            return self._remember(key, profile)
+
+        try:
+            started = time.perf_counter()
+            with stage_timer("jd_profile"):
+                profile = extract_job_profile(job_description)
+            elapsed = time.perf_counter() - started
+            profile["extract_ms"] = round(elapsed * 1000, 3)
+            self._store.put(key, profile)
+            with self._lock:
+                self.misses += 1
+                self.extract_seconds += elapsed
+            self._count("miss")
+            logging.info(f"🧾 New job-description profile {key[:12]}: {profile['seniority']}, "
+                         f"{len(profile['required_skills'])} skills")
+            return self._remember(key, profile)
+        finally:
+            if leader:
+                with self._lock:
+                    self._pending.pop(key).set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            result = {
+                "lookups": lookups,
+                "hits": self.hits,
+                "local_hits": self.local_hits,
+                "misses": self.misses,
+                "waited": self.waited,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "avg_extract_ms": round(self.extract_seconds * 1000 / self.misses, 3) if self.misses else 0.0,
+                "extract_ms_saved": round(self.saved_ms, 1),
+            }
+        store_stats = self._store.stats()
+        result.update({"backend": store_stats["backend"], "entries": store_stats["entries"],
+                       "bytes": store_stats["bytes"]})
+        return result
 
-        logging.info("📤 Sending data to Gemini to fill LaTeX template")
+job_profiles = JobProfileStore(create_store("jd_profiles"), JD_PROFILE_LOCAL_ENTRIES)
 
-        # 🧠 Prompt: Resume formatting using LaTeX template with placeholders
-        format_prompt = PROMPT_FORMATTER.replace("<RESUME_TEXT>", resume_text).replace("<LATEX_TEMPLATE>", LATEX_TEMPLATE)
+def job_profile_summary(profile):
+    return {
+        "id": profile["id"],
+        "seniority": profile["seniority"],
+        "min_years": profile["min_years"],
+        "required_skills": [name for name, _ in profile["required_skills"]],
+        "required_certifications": profile["required_certifications"],
+        "key_phrases": profile["key_phrases"],
+    }
 
-        response = model.generate_content(format_prompt)
+def ats_prescore_batch(resume_text, job_descriptions):
+    import numpy as np
+    # 🧾 Posting term counts come from the shared profile store; only the resume is tokenized here
+    resume_vector = {}
+    for term in ats_terms(resume_text):
+        resume_vector[term] = resume_vector.get(term, 0) + 1
+    docs = [resume_vector] + [job_profiles.get(jd)["keyword_vector"] for jd in job_descriptions]
+    vocab = {}
+    rows, cols, values = [], [], []
+    for row, vector in enumerate(docs):
+        for term, count in vector.items():
+            rows.append(row)
+            cols.append(vocab.setdefault(term, len(vocab)))
+            values.append(count)
+
+    counts = np.zeros((len(docs), max(len(vocab), 1)), dtype=np.float32)
+    np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)),
+              np.asarray(values, dtype=np.float32))
+
+    # Smoothed IDF over resume + all postings, sublinear TF
+    df = (counts > 0).sum(axis=0)
+    idf = np.log((1.0 + len(docs)) / (1.0 + df)) + 1.0
+    weights = np.log1p(counts) * idf
+
+    norms = np.linalg.norm(weights, axis=1)
+    norms[norms == 0] = 1.0
+    unit = weights / norms[:, None]
+    resume_vec, jd_vecs = unit[0], unit[1:]
+    similarity = jd_vecs @ resume_vec
+
+    # Share of each posting's keyword weight that the resume already covers
+    present = (counts[0] > 0).astype(np.float32)
+    jd_weights = weights[1:]
+    totals = jd_weights.sum(axis=1)
+    totals[totals == 0] = 1.0
+    coverage = (jd_weights @ present) / totals
+
+    scores = np.clip(10.0 * (0.7 * coverage + 0.3 * similarity), 0.0, 10.0)
+
+    terms_by_index = np.array(list(vocab), dtype=object) if vocab else np.array([], dtype=object)
+    results = []
+    for i in range(len(job_descriptions)):
+        missing_weights = jd_weights[i] * (1.0 - present)
+        top = np.argsort(-missing_weights)[:20]
+        missing = [terms_by_index[j] for j in top if missing_weights[j] > 0 and " " not in terms_by_index[j]]
+        results.append({
+            "score": round(float(scores[i]), 1),
+            "keyword_coverage": round(float(coverage[i]), 3),
+            "tfidf_similarity": round(float(similarity[i]), 3),
+            "missing_keywords": missing
+        })
+    return results
+
+def ats_prescore(resume_text, job_description):
+    return ats_prescore_batch(resume_text, [job_description])[0]
+
+def ats_gate_skips_llm(prescore):
+    return prescore["score"] >= ATS_GATE_SKIP_ABOVE
+
+def ats_local_feedback(prescore):
+    missing = ", ".join(prescore["missing_keywords"]) or "none"
+    return (f"- **Job Match:** Local keyword match score {prescore['score']}/10 "
+            f"({prescore['keyword_coverage']:.0%} of job keywords covered).\n\n"
+            f"- **Missing Elements:** {missing}")
+
+# 📏 Agreement between local pre-scores and LLM scores
+class ScoreAgreement:
+    def __init__(self, max_pairs=1000):
+        self._pairs = deque(maxlen=max_pairs)
+        self._lock = threading.Lock()
+        self.gated = 0
+
+    def record(self, prescore, llm_score):
+        with self._lock:
+            self._pairs.append((float(prescore), float(llm_score)))
+
+    def record_gated(self):
+        with self._lock:
+            self.gated += 1
+
+    def stats(self, pairs=None):
+        with self._lock:
+            pairs = list(self._pairs) if pairs is None else list(pairs)
+            gated = self.gated
+        report = {"pairs": len(pairs), "llm_calls_skipped_by_gate": gated}
+        if not pairs:
+            return report
+        import numpy as np
+        local, llm = np.array(pairs, dtype=np.float64).T
+        diff = np.abs(local - llm)
+        report.update({
+            "mean_abs_error": round(float(diff.mean()), 3),
+            "within_1_point": round(float((diff <= 1.0).mean()), 3),
+        })
+        if len(pairs) > 1 and local.std() > 0 and llm.std() > 0:
+            report["pearson_r"] = round(float(np.corrcoef(local, llm)[0, 1]), 3)
+        return report
 
-        if not response.text:
-            return jsonify({"error": "Gemini failed to generate resume."}), 500
+ats_agreement = ScoreAgreement()
 
-        latex_resume = response.text.strip()
-        # 🧽 Clean LaTeX if wrapped in markdown
-        if latex_resume.startswith("```latex") and latex_resume.endswith("```"):
-                latex_resume = latex_resume.replace("```latex", "").replace("```", "").strip()
+# ✅ Pipeline stages shared by the sync and job-mode generate routes
+class PipelineError(Exception):
+    pass
 
-        # 🧠 Evaluate the resume using the evaluator prompt
-        evaluator_prompt = PROMPT_EVALUATOR.replace("<LATEX_CODE>", latex_resume).replace("<JOB_DESCRIPTION>", job_description)
-        eval_response = model.generate_content(evaluator_prompt)
-        score = 7  # Default fallback score
-        feedback = "No feedback available"
-        optimization_message = ""  # ✅ Declare in outer scope
+def resolve_generation_model(user_api_key):
+    # ⚙️ Configure Gemini based on provided API key
+    if not HAS_GENAI:
+        return None
+    try:
+        if user_api_key:
+            logging.info("🔑 Using user-provided Gemini key")
+            return model_for_key(user_api_key)
+        logging.info("🧠 Using default Gemini model")
+        return get_default_model()
+    except Exception as e:
+        logging.warning(f"❗ Failed to configure Gemini: {e}")
+        return default_model
+
+def format_resume_latex(model, resume_text, on_token=None):
+    logging.info("📤 Sending data to Gemini to fill LaTeX template")
+
+    # 🧠 Prompt: Resume formatting using LaTeX template with placeholders
+    with stage_timer("prompt_build"):
+        format_prompt = templates.get("formatter").replace("<RESUME_TEXT>", resume_text) \
+            .replace("<LATEX_TEMPLATE>", templates.get("latex_template"))
+
+    response = generate_content(model, format_prompt, on_token=on_token, call="formatter")
+
+    if not response.text:
+        raise PipelineError("Gemini failed to generate resume.")
+
+    # 🧽 Strip markdown fences, escape stray specials, close dangling braces/environments
+    return repair_latex(response.text.strip(), "formatted")["latex"].strip()
+
+def evaluate_generated_resume(model, latex_resume, job_description, on_token=None):
+    # 🧠 Evaluate the resume using the evaluator prompt
+    with stage_timer("prompt_build"):
+        resume_text = resume_for_prompt(latex_resume)
+        evaluator_prompt = templates.get("evaluator").replace("<LATEX_CODE>", resume_text).replace("<JOB_DESCRIPTION>", job_description)
+    prompt_size_stats.record("evaluator", evaluator_prompt, latex_resume, resume_text)
+    eval_response = generate_content(model, evaluator_prompt, on_token=on_token, call="evaluator")
+
+    if not (eval_response and eval_response.text):
+        return 7, "No feedback available", False  # Default fallback score
+
+    with stage_timer("parse_feedback"):
+        raw_feedback = eval_response.text.strip()
+        score = parse_score(raw_feedback, default=7)
+        feedback = enforce_line_breaks(raw_feedback)
+    return score, feedback, True
+
+def run_resume_pipeline(model, resume_text, job_description, on_stage=None, on_token=None):
+    with stage_timer("pipeline_format"):
+        latex_resume = format_resume_latex(model, resume_text,
+                                           on_token=(lambda text: on_token("formatting", text)) if on_token else None)
+    if on_stage:
+        on_stage("formatted", {"latex_code": latex_resume})
+
+    return tailor_resume_for_job(model, latex_resume, job_description, on_stage=on_stage, on_token=on_token)
+
+# 🎯 Job-specific half of the pipeline (evaluate + optimize an already formatted resume)
+def tailor_resume_for_job(model, latex_resume, job_description, on_stage=None, on_token=None, prescore=None):
+    def report(stage, **data):
+        if on_stage:
+            on_stage(stage, data)
+
+    def tokens_for(stage):
+        if not on_token:
+            return None
+        return lambda text: on_token(stage, text)
+
+    if prescore is None:
+        prescore = ats_prescore(latex_resume, job_description)
+
+    if ats_gate_skips_llm(prescore):
+        # ⚡ Strong local keyword match — skip the LLM evaluate + optimize calls
+        logging.info(f"⚡ ATS pre-score {prescore['score']} passes gate, skipping LLM evaluation")
+        ats_agreement.record_gated()
+        score, feedback, evaluated = round(prescore["score"]), ats_local_feedback(prescore), False
+    else:
+        with stage_timer("pipeline_evaluate"):
+            score, feedback, evaluated = evaluate_generated_resume(model, latex_resume, job_description,
+                                                                   on_token=tokens_for("evaluating"))
+        if evaluated:
+            ats_agreement.record(prescore["score"], score)
+    report("evaluated", score=score, feedback=feedback, ats_prescore=prescore)
+
+    optimization_message = ""
+    if evaluated:
+        # 🧠 AUTO-OPTIMIZE the resume using feedback
+        with stage_timer("pipeline_optimize"):
+            optimized_latex = optimize_resume_for_job(model, latex_resume, job_description, feedback,
+                                                      on_token=tokens_for("optimizing"))
+
+        # Store optimization message if changed
+        if optimized_latex != latex_resume:
+            optimization_message = "Resume improved based on feedback and job description."
+            latex_resume = optimized_latex  # ✅ Replace with improved version
+    report("optimized", latex_code=latex_resume, optimization_message=optimization_message)
 
-        if eval_response and eval_response.text:
-            raw_feedback = eval_response.text.strip()
+    return {
+        "latex_code": latex_resume,
+        "score": score,
+        "feedback": feedback,
+        "optimization_message": optimization_message,
+        "ats_prescore": prescore
+    }
 
-    # Extract score robustly
-            score_patterns = [
-                r"score[:\- ]*(\d{1,2})/10",         
-                r"overall score[:= ]*(\d{1,2})/10",  
-                r"(\d{1,2})[\s]*/[\s]*10"            
-                ]
-            score = 7  # fallback
-            for pattern in score_patterns:
-                match = re.search(pattern, raw_feedback, re.IGNORECASE)
-                if match:
-                    score = int(match.group(1))
-                    break
+def save_resume_session(result, resume_text, job_description, company_name, user_api_key):
+    # 🪪 Generate a unique ID for this resume session
+    resume_id = str(uuid.uuid4())
+
+    # ⏳ Save initial data
+    resume_store[resume_id] = {
+        "latex_code": result["latex_code"],
+        "company_name": company_name,
+        "resume_text": resume_text,
+        "job_description": job_description,
+        "score": result["score"],
+        "feedback": result["feedback"],
+        "optimization_message": result["optimization_message"],
+        "ats_prescore": result.get("ats_prescore"),
+        "history": [new_revision(1, "generated")]
+    }
 
-            feedback = enforce_line_breaks(raw_feedback)
+    if user_api_key:
+        resume_api_keys.set(resume_id, user_api_key.encode("utf-8"))
+
+    logging.info(f"✅ Resume generated and stored with ID: {resume_id}")
+    return resume_id
+
+# ✅ Revision history: the head lives in entry["latex_code"]; every older revision keeps a
+# zlib-compressed reverse delta against the revision after it, plus its score and feedback
+REVISION_MAX = _env_int("REVISION_MAX", 50)
+
+def _pack(value):
+    raw = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    return base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+
+def _unpack(packed):
+    return json.loads(zlib.decompress(base64.b64decode(packed)).decode("utf-8"))
+
+def encode_delta(base, target):
+    # Ops: [i1, i2] copies base lines i1..i2, a string inserts literal text
+    base_lines, target_lines = base.splitlines(True), target.splitlines(True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(target_lines[j1:j2]))
+    return _pack(ops)
+
+def apply_delta(base, delta):
+    base_lines = base.splitlines(True)
+    return "".join(op if isinstance(op, str) else "".join(base_lines[op[0]:op[1]]) for op in _unpack(delta))
+
+def new_revision(rev, source, **extra):
+    return dict({"rev": rev, "source": source, "created_at": time.time()}, **extra)
+
+def revision_history(entry):
+    history = entry.get("history")
+    if not history:
+        # Sessions stored before revisions existed start with their current text as rev 1
+        history = entry["history"] = [new_revision(1, "generated")]
+    return history
+
+def record_revision(entry, new_latex, source, **extra):
+    history = revision_history(entry)
+    old_latex = entry.get("latex_code", "")
+    if new_latex == old_latex:
+        return history[-1]["rev"]
+
+    # Freeze the outgoing head: its score/feedback and how to rebuild it from the new head
+    head = history[-1]
+    head["score"] = entry.get("score")
+    head["feedback"] = _pack(entry.get("feedback", ""))
+    head["delta"] = encode_delta(new_latex, old_latex)
+    history.append(new_revision(head["rev"] + 1, source, **extra))
+    entry["latex_code"] = new_latex
+
+    # Reverse deltas mean the oldest revision can be dropped without touching the rest
+    del history[:-REVISION_MAX]
+    return history[-1]["rev"]
+
+def revision_snapshot(entry, rev):
+    history = revision_history(entry)
+    latex = entry.get("latex_code", "")
+    for index in range(len(history) - 1, -1, -1):
+        item = history[index]
+        head = index == len(history) - 1
+        if not head:
+            latex = apply_delta(latex, item["delta"])
+        if item["rev"] == rev:
+            return {
+                "rev": rev,
+                "source": item["source"],
+                "created_at": item["created_at"],
+                "latex_code": latex,
+                "score": entry.get("score") if head else item.get("score"),
+                "feedback": entry.get("feedback", "") if head else _unpack(item["feedback"]),
+            }
+    return None
+
+# ✅ Single-flight: identical concurrent submissions share one pipeline run
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> in-flight call state
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.llm_calls_saved = 0
+
+    def do(self, key, fn, on_join=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None,
+                                           "error": None, "llm_calls": 0}
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            logging.info("🤝 Identical generation in flight — waiting for its result")
+            if on_join:
+                on_join()
+            call["done"].wait()
+            with self._lock:
+                self.llm_calls_saved += call["llm_calls"]
+            metrics.inc("resume_coalesced_requests_total", help="Submissions served by an in-flight identical run")
+            metrics.inc("resume_coalesced_llm_calls_saved_total", call["llm_calls"],
+                        help="Gemini calls avoided by coalescing")
+            if call["error"] is not None:
+                raise call["error"]
+            return dict(call["result"]), True
+
+        try:
+            with track_llm_usage() as usage:
+                call["result"] = fn()
+            return dict(call["result"]), False
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            call["llm_calls"] = usage.calls - usage.cached_calls
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "llm_calls_saved": self.llm_calls_saved,
+            }
 
-    # 🧠 AUTO-OPTIMIZE the resume using feedback
-            optimized_latex = optimize_resume_for_job(model, latex_resume, job_description, feedback)
+generation_flights = SingleFlight()
+
+def generation_key(model, resume_text, job_description):
+    model_name = getattr(model, "model_name", None) or type(model).__name__
+    digest = hashlib.sha256()
+    for part in (model_name, resume_text, job_description):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def run_resume_pipeline_coalesced(model, resume_text, job_description, on_stage=None, on_token=None, on_join=None):
+    result, _ = generation_flights.do(
+        generation_key(model, resume_text, job_description),
+        lambda: run_resume_pipeline(model, resume_text, job_description, on_stage=on_stage, on_token=on_token),
+        on_join=on_join,
+    )
+    return result
+
+# ✅ Background job pool for /generate_resume (job mode)
+class JobQueueFull(Exception):
+    pass
+
+JOB_STAGES = {
+    "queued": 0.0,
+    "formatting": 0.1,
+    "coalesced": 0.1,
+    "formatted": 0.4,
+    "evaluated": 0.7,
+    "optimized": 0.95,
+    "done": 1.0,
+}
+
+class JobManager:
+    def __init__(self, workers=4, max_queue=32, ttl=3600, store=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.store = store  # shared snapshots so any worker process can answer a poll
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="resume-job")
+        return self._executor
+
+    def submit(self, fn, *args):
+        with self._lock:
+            self._prune()
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise JobQueueFull()
+            job_id = str(uuid.uuid4())
+            now = time.time()
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "stage": "queued",
+                "progress": 0.0,
+                "result": {},
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            self._queued += 1
+            self.submitted += 1
+            snapshot = self._snapshot(job_id)
+        self._publish(job_id, snapshot)
+        self._pool().submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        self.update(job_id, status="running", stage="formatting")
+        try:
+            resume_id = fn(job_id, *args)
+            self.update(job_id, status="done", stage="done", resume_id=resume_id)
+            with self._lock:
+                self.completed += 1
+        except GeminiUnavailable as e:
+            # 🚦 Same 503 + Retry-After the synchronous route returns, so pollers know to back off
+            logging.warning(f"🚦 Job {job_id} rejected: {e}")
+            self.update(job_id, status="failed", error=str(e), error_status=503, retry_after=e.retry_after or 5)
+            with self._lock:
+                self.failed += 1
+        except Exception as e:
+            logging.exception(f"❌ Job {job_id} failed")
+            message = str(e) if isinstance(e, PipelineError) else "Server error occurred during resume generation."
+            self.update(job_id, status="failed", error=message, error_status=500)
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def update(self, job_id, stage=None, result=None, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if stage:
+                job["stage"] = stage
+                job["progress"] = JOB_STAGES.get(stage, job["progress"])
+            if result:
+                job["result"].update(result)
+            job.update(fields)
+            job["updated_at"] = time.time()
+            snapshot = self._snapshot(job_id)
+        self._publish(job_id, snapshot)
+
+    def _snapshot(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return dict(job, result=dict(job["result"]))
+
+    def _publish(self, job_id, snapshot):
+        if self.store is not None and snapshot is not None:
+            self.store[job_id] = snapshot
+
+    def get(self, job_id):
+        with self._lock:
+            snapshot = self._snapshot(job_id)
+        if snapshot is None and self.store is not None:
+            snapshot = self.store.get(job_id)
+        return snapshot
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j for j, job in self._jobs.items()
+                       if job["status"] in ("done", "failed") and job["updated_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queued,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
 
-    # Store optimization message if changed
-            
-            if optimized_latex != latex_resume:
-                optimization_message = "Resume improved based on feedback and job description."
-                latex_resume = optimized_latex  # ✅ Replace with improved version
+job_manager = JobManager(
+    workers=_env_int("JOB_WORKERS", 4),
+    max_queue=_env_int("JOB_MAX_QUEUE", 32),
+    ttl=_env_int("JOB_TTL", 3600),
+    store=None if RESUME_STORE_BACKEND == "memory" else create_store("jobs"),
+)
 
+def _resume_pipeline_job(job_id, model, resume_text, job_description, company_name, user_api_key):
+    def on_stage(stage, data):
+        job_manager.update(job_id, stage=stage, result=data)
 
+    result = run_resume_pipeline_coalesced(model, resume_text, job_description, on_stage=on_stage,
+                                           on_join=lambda: job_manager.update(job_id, stage="coalesced"))
+    return save_resume_session(result, resume_text, job_description, company_name, user_api_key)
 
+# ✅ Route to generate resume
+@bp.route("/generate_resume", methods=["POST"])
+@login_required
+def generate_resume():
+    try:
+        # 🌐 Get user input from the form
+        resume_text = request.form.get("resume_content", "").strip()
+        job_description = request.form.get("job_description", "").strip()
+        user_api_key = request.form.get("api_key", "").strip()
+        company_name = request.form.get("company_name", "").strip()
+        async_mode = request.form.get("async", "").lower() in ("1", "true", "yes")
 
+        if not resume_text or not job_description:
+            return jsonify({"error": "Resume and Job Description are required."}), 400
 
+        model = resolve_generation_model(user_api_key)
 
-        # 🪪 Generate a unique ID for this resume session
-        resume_id = str(uuid.uuid4())
+        if not model:
+            return jsonify({"error": "Gemini model not available."}), 500
 
-        # ⏳ Save initial data
-        resume_store[resume_id] = {
-            "latex_code": latex_resume,
-            "company_name": company_name,
-            "api_key": user_api_key or None,
-            "resume_text": resume_text,
-            "job_description": job_description,
-            "score": score,
-            "feedback": feedback,
-            "optimization_message": optimization_message
-        }
+        # 📨 Job mode: queue the pipeline and return immediately
+        if async_mode:
+            try:
+                job_id = job_manager.submit(_resume_pipeline_job, model, resume_text,
+                                            job_description, company_name, user_api_key)
+            except JobQueueFull:
+                return jsonify({"error": "Too many pending jobs, please retry shortly."}), 429, {"Retry-After": "5"}
 
+            return jsonify({
+                "message": "Resume generation queued",
+                "job_id": job_id,
+                "status_url": url_for(".job_status", job_id=job_id),
+                "queue_depth": job_manager.stats()["queue_depth"]
+            }), 202
 
+        try:
+            result = run_resume_pipeline_coalesced(model, resume_text, job_description)
+        except GeminiUnavailable as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after or 5)}
+        except PipelineError as e:
+            return jsonify({"error": str(e)}), 500
 
-        logging.info(f"✅ Resume generated and stored with ID: {resume_id}")
+        resume_id = save_resume_session(result, resume_text, job_description, company_name, user_api_key)
 
         return jsonify({
             "message": "Resume LaTeX generated",
             "resume_id": resume_id,
-            "latex_code": latex_resume,
-            "score": score,
-            "feedback": feedback
+            "latex_code": result["latex_code"],
+            "score": result["score"],
+            "feedback": result["feedback"],
+            "ats_prescore": result["ats_prescore"]
         }), 200
 
     except Exception as e:
         logging.exception("❌ Error in generate_resume route")
         return jsonify({"error": "Server error occurred during resume generation."}), 500
 
+# ✅ Batch: one resume against many job descriptions
+BATCH_MAX_JOBS = _env_int("BATCH_MAX_JOBS", 25)
+BATCH_MAX_CONCURRENCY = _env_int("BATCH_MAX_CONCURRENCY", 4)
+
+def _batch_jobs_from_request():
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        jobs = payload.get("jobs") or []
+        return payload, [
+            {
+                "job_description": str(job.get("job_description", "")).strip(),
+                "company_name": str(job.get("company_name", "")).strip()
+            }
+            for job in jobs if isinstance(job, dict)
+        ]
+
+    descriptions = request.form.getlist("job_description")
+    companies = request.form.getlist("company_name")
+    companies += [""] * (len(descriptions) - len(companies))
+    return request.form, [
+        {"job_description": jd.strip(), "company_name": company.strip()}
+        for jd, company in zip(descriptions, companies)
+    ]
+
+@bp.route("/generate_resume_batch", methods=["POST"])
+@login_required
+def generate_resume_batch():
+    try:
+        params, jobs = _batch_jobs_from_request()
+        resume_text = str(params.get("resume_content", "")).strip()
+        user_api_key = str(params.get("api_key", "")).strip()
+
+        if not resume_text or not jobs or any(not job["job_description"] for job in jobs):
+            return jsonify({"error": "Resume and at least one Job Description are required."}), 400
+        if len(jobs) > BATCH_MAX_JOBS:
+            return jsonify({"error": f"At most {BATCH_MAX_JOBS} job descriptions per batch."}), 400
+
+        try:
+            concurrency = int(params.get("concurrency") or BATCH_MAX_CONCURRENCY)
+        except (TypeError, ValueError):
+            concurrency = BATCH_MAX_CONCURRENCY
+        concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(jobs)))
+
+        model = resolve_generation_model(user_api_key)
+        if not model:
+            return jsonify({"error": "Gemini model not available."}), 500
+
+        # 🧠 The formatter step does not depend on the job — run it once
+        try:
+            formatted_latex = format_resume_latex(model, resume_text)
+        except GeminiUnavailable as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after or 5)}
+        except PipelineError as e:
+            return jsonify({"error": str(e)}), 500
+
+        # 📏 Score every posting locally in one vectorized pass
+        prescores = ats_prescore_batch(formatted_latex, [job["job_description"] for job in jobs])
+
+        def tailor(job, prescore):
+            result = tailor_resume_for_job(model, formatted_latex, job["job_description"], prescore=prescore)
+            return save_resume_session(result, resume_text, job["job_description"],
+                                       job["company_name"], user_api_key), result
+
+        # 🔀 Fan out per-job evaluate + optimize
+        results = []
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="resume-batch") as pool:
+            futures = [pool.submit(tailor, job, prescore) for job, prescore in zip(jobs, prescores)]
+            for index, (job, future) in enumerate(zip(jobs, futures)):
+                item = {"index": index, "company_name": job["company_name"]}
+                try:
+                    resume_id, result = future.result()
+                    item.update({
+                        "resume_id": resume_id,
+                        "score": result["score"],
+                        "feedback": result["feedback"],
+                        "ats_prescore": result["ats_prescore"],
+                        "latex_code": result["latex_code"]
+                    })
+                except Exception:
+                    logging.exception(f"❌ Batch item {index} failed")
+                    item["error"] = "Server error occurred during resume generation."
+                results.append(item)
+
+        logging.info(f"✅ Batch generated {sum('resume_id' in r for r in results)}/{len(jobs)} resumes")
+
+        return jsonify({
+            "message": "Batch resume generation complete",
+            "concurrency": concurrency,
+            "results": results
+        }), 200
+
+    except Exception as e:
+        logging.exception("❌ Error in generate_resume_batch route")
+        return jsonify({"error": "Server error occurred during batch resume generation."}), 500
+
+# ✅ Stream pipeline progress + Gemini tokens as Server-Sent Events
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@bp.route("/generate_resume_stream", methods=["POST"])
+@login_required
+def generate_resume_stream():
+    resume_text = request.form.get("resume_content", "").strip()
+    job_description = request.form.get("job_description", "").strip()
+    user_api_key = request.form.get("api_key", "").strip()
+    company_name = request.form.get("company_name", "").strip()
+
+    if not resume_text or not job_description:
+        return jsonify({"error": "Resume and Job Description are required."}), 400
+
+    model = resolve_generation_model(user_api_key)
+    if not model:
+        return jsonify({"error": "Gemini model not available."}), 500
+
+    events = queue.Queue()
+
+    def on_stage(stage, data):
+        events.put(("stage", dict(data, stage=stage)))
+
+    def on_token(stage, text):
+        events.put(("token", {"stage": stage, "text": text}))
+
+    joined = []
+
+    def on_join():
+        joined.append(True)
+        on_stage("coalesced", {})
+
+    def worker(job_id):
+        try:
+            result = run_resume_pipeline_coalesced(model, resume_text, job_description,
+                                                   on_stage=on_stage, on_token=on_token, on_join=on_join)
+            if joined:
+                # 🤝 Shared run: replay its final stage since this stream saw no tokens
+                on_stage("optimized", {"latex_code": result["latex_code"], "score": result["score"],
+                                       "feedback": result["feedback"],
+                                       "optimization_message": result["optimization_message"]})
+            resume_id = save_resume_session(result, resume_text, job_description, company_name, user_api_key)
+            events.put(("done", dict(result, resume_id=resume_id)))
+            return resume_id
+        except (PipelineError, GeminiUnavailable) as e:
+            events.put(("error", {"error": str(e)}))
+            raise
+        except Exception:
+            events.put(("error", {"error": "Server error occurred during resume generation."}))
+            raise  # logged and recorded as a failed job by job_manager
+        finally:
+            events.put(None)
+
+    # 🧵 Same bounded worker pool as job mode, so concurrent streams can't spawn unlimited threads
+    try:
+        job_id = job_manager.submit(worker)
+    except JobQueueFull:
+        return jsonify({"error": "Too many pending jobs, please retry shortly."}), 429, {"Retry-After": "5"}
+
+    def stream():
+        yield sse_event("stage", {"stage": "formatting", "job_id": job_id})
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            yield sse_event(*item)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# ✅ Poll a queued generation job
+@bp.route("/jobs/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Invalid job ID"}), 404
+
+    job["queue_depth"] = job_manager.stats()["queue_depth"]
+    if job.get("retry_after"):
+        return jsonify(job), 200, {"Retry-After": str(job["retry_after"])}
+    return jsonify(job), 200
+
+# ✅ Job pool overview (queue depth, running jobs)
+@bp.route("/jobs", methods=["GET"])
+@login_required
+def jobs_overview():
+    return jsonify(job_manager.stats()), 200
+
+# ✅ One score parser for every evaluator response
+SCORE_PATTERNS = [
+    re.compile(r"overall score[:= ]*(\d{1,2})\s*/\s*10", re.IGNORECASE),
+    re.compile(r"score[:\- ]*(\d{1,2})\s*/\s*10", re.IGNORECASE),
+    re.compile(r"(\d{1,2})\s*/\s*10"),
+]
+
+def parse_score(raw, default=0):
+    for pattern in SCORE_PATTERNS:
+        match = pattern.search(raw)
+        if match and 0 <= int(match.group(1)) <= 10:
+            return int(match.group(1))
+    return default
+
 # ✅ Evaluate resume match against job description using Gemini
-def evaluate_resume_job_match(model, latex_resume, job_description):
+def evaluate_resume_job_match(model, latex_resume, job_description, compact=None):
+    score, feedback = score_resume_job_match(model, latex_resume, job_description, compact)
+    return (0 if score is None else score, feedback)
+
+# Same as evaluate_resume_job_match, but the score is None when Gemini gave no parseable score
+def score_resume_job_match(model, latex_resume, job_description, compact=None):
     try:
         logging.info("📊 Evaluating resume against job description...")
 
-        prompt = PROMPT_EVALUATOR \
-            .replace("<LATEX_CODE>", latex_resume) \
-            .replace("<JOB_DESCRIPTION>", job_description)
+        with stage_timer("prompt_build"):
+            resume_text = resume_for_prompt(latex_resume, compact)
+            prompt = templates.get("evaluator") \
+                .replace("<LATEX_CODE>", resume_text) \
+                .replace("<JOB_DESCRIPTION>", job_description)
+        prompt_size_stats.record("evaluator", prompt, latex_resume, resume_text)
 
-        response = model.generate_content(prompt)
+        response = generate_content(model, prompt, call="evaluator")
 
         if not response.text:
-            return (0, "No feedback received from Gemini.")
+            return (None, "No feedback received from Gemini.")
 
         # 🎯 Assume Gemini returns something like:
         # Score: 7/10
         # Feedback: <reason here>
-        raw = response.text.strip()
-        score = 0
-        for line in raw.splitlines():
-            if "Score" in line:
-                try:
-                    score = int(line.split(":")[1].strip().split("/")[0])
-                    break
-                except:
-                    continue
+        with stage_timer("parse_feedback"):
+            raw = response.text.strip()
+            score = parse_score(raw, default=None)
 
-        # ✅ FORMAT the feedback here before returning
-        formatted_feedback = enforce_line_breaks(raw)
+            # ✅ FORMAT the feedback here before returning
+            formatted_feedback = enforce_line_breaks(raw)
         return (score, formatted_feedback)
 
     except Exception as e:
         logging.warning(f"⚠️ Resume evaluation failed: {e}")
-        return (0, "Unable to evaluate resume-job match due to an error.")
+        return (None, "Unable to evaluate resume-job match due to an error.")
 
 def enforce_line_breaks(feedback_text):
     import re
@@ -256,27 +2356,38 @@ def enforce_line_breaks(feedback_text):
 
 
 
+def _form_flag(name):
+    # None means "not given" so callers fall back to their configured default
+    value = request.form.get(name, "").strip().lower()
+    if not value:
+        return None
+    return value in ("1", "true", "yes")
+
 # ✅ Re-evaluate route or optional optimization call can go here
-@app.route("/evaluate_resume", methods=["POST"])
+@bp.route("/evaluate_resume", methods=["POST"])
 @login_required
 def evaluate_resume():
     try:
         resume_id = request.form.get("resume_id")
 
-        if not resume_id or resume_id not in resume_store:
+        entry = resume_store.get(resume_id) if resume_id else None
+        if entry is None:
             return jsonify({"error": "Invalid resume ID"}), 400
 
-        entry = resume_store[resume_id]
-        model = default_model
-        if entry.get("api_key"):
-            genai.configure(api_key=entry["api_key"])
-            model = genai.GenerativeModel("gemini-1.5-flash")
+        model = model_for_key(resume_api_key(resume_id))
 
-        score, feedback = evaluate_resume_job_match(model, entry["latex_code"], entry["job_description"])
+        score, feedback = score_resume_job_match(model, entry["latex_code"], entry["job_description"],
+                                                 compact=_form_flag("compact"))
+        if score is None:
+            score = 0
+        else:
+            # 📏 Only a real Gemini score says anything about how well the local pre-score agrees
+            ats_agreement.record(ats_prescore(entry["latex_code"], entry["job_description"])["score"], score)
 
         # Save to store
-        resume_store[resume_id]["score"] = score
-        resume_store[resume_id]["feedback"] = feedback
+        entry["score"] = score
+        entry["feedback"] = feedback
+        resume_store[resume_id] = entry
 
         return jsonify({
             "resume_id": resume_id,
@@ -288,32 +2399,336 @@ def evaluate_resume():
         logging.exception("❌ Error in evaluate_resume route")
         return jsonify({"error": "Failed to evaluate resume"}), 500
 
+# ✅ LaTeX lint + auto-repair (pure Python, runs before anything reaches xelatex)
+LATEX_ALIGN_ENVS = {"tabular", "tabular*", "tabularx", "array", "align", "align*", "alignat", "alignat*",
+                    "eqnarray", "matrix", "pmatrix", "bmatrix", "cases", "longtable", "split"}
+LATEX_MATH_ENVS = {"equation", "equation*", "align", "align*", "alignat", "alignat*", "eqnarray",
+                   "math", "displaymath", "gather", "gather*", "multline", "multline*"}
+# First brace argument is a URL / path / label and must be copied verbatim
+LATEX_RAW_ARG_COMMANDS = {"href", "url", "input", "include", "includegraphics", "label", "ref", "cite",
+                          "hyperref", "nolinkurl", "path", "verb"}
+LATEX_LIST_CLOSERS = ("\\item", "\\section", "\\subsection", "\\end{", "\\begin{", "\\resume")
+
+_fence_line_re = re.compile(r"^[ \t]*```[a-zA-Z]*[ \t]*$", re.MULTILINE)
+_documentclass_re = re.compile(r"^[ \t]*\\documentclass", re.MULTILINE)
+
+def _raw_group_end(line, i):
+    # Index just past the balanced {...} group starting at line[i]
+    depth = 0
+    for j in range(i, len(line)):
+        if line[j] == "\\":
+            continue
+        if line[j] == "{" and (j == 0 or line[j - 1] != "\\"):
+            depth += 1
+        elif line[j] == "}" and line[j - 1] != "\\":
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return len(line)
+
+def _unescaped_dollars(line):
+    count, i = 0, 0
+    while i < len(line):
+        if line[i] == "\\":
+            i += 2
+            continue
+        if line[i] == "%" and not (i and line[i - 1].isdigit()):
+            break
+        if line[i] == "$":
+            count += 1
+        i += 1
+    return count
+
+def _lint_body_line(line, envs, fixes):
+    # One pass: escape stray specials outside math/alignment, track envs and brace balance
+    if _unescaped_dollars(line) % 2:
+        repaired = re.sub(r"(?<!\\)\$(?=\d)", r"\\$", line)
+        if repaired != line:
+            fixes["dollar"] = fixes.get("dollar", 0) + repaired.count("\\$") - line.count("\\$")
+            line = repaired
+
+    out, depth, i, in_math = [], 0, 0, any(env in LATEX_MATH_ENVS for env in envs)
+    while i < len(line):
+        c = line[i]
+        if c == "\\":
+            match = re.match(r"\\([a-zA-Z@]+\*?)", line[i:])
+            if not match:
+                pair = line[i:i + 2]
+                if pair in ("\\(", "\\["):
+                    in_math = True
+                elif pair in ("\\)", "\\]"):
+                    in_math = False
+                out.append(pair)
+                i += 2
+                continue
+            name = match.group(1)
+            out.append(match.group(0))
+            i += len(match.group(0))
+            if name in ("begin", "end") and line[i:i + 1] == "{":
+                end = _raw_group_end(line, i)
+                env = line[i + 1:end - 1]
+                if name == "begin":
+                    envs.append(env)
+                elif env not in envs:
+                    # 🧩 Stray \end{...} with no matching \begin — drop it
+                    out.pop()
+                    fixes["stray_end"] = fixes.get("stray_end", 0) + 1
+                    i = end
+                    continue
+                else:
+                    # 🧩 Close anything still open inside this environment first
+                    while envs[-1] != env:
+                        out.insert(len(out) - 1, f"\\end{{{envs.pop()}}}")
+                        fixes["unclosed_env"] = fixes.get("unclosed_env", 0) + 1
+                    envs.pop()
+                out.append(line[i:end])
+                i = end
+                continue
+            if name in LATEX_RAW_ARG_COMMANDS:
+                while line[i:i + 1] == "[":
+                    close = line.find("]", i)
+                    close = len(line) - 1 if close == -1 else close
+                    out.append(line[i:close + 1])
+                    i = close + 1
+                if line[i:i + 1] == "{":
+                    end = _raw_group_end(line, i)
+                    out.append(line[i:end])
+                    i = end
+            continue
+        if c == "%":
+            if i and line[i - 1].isdigit():
+                out.append("\\%")
+                fixes["percent"] = fixes.get("percent", 0) + 1
+                i += 1
+                continue
+            out.append(line[i:])  # real comment
+            break
+        if c == "$":
+            in_math = not in_math
+        elif c == "&" and not in_math and not any(env in LATEX_ALIGN_ENVS for env in envs):
+            out.append("\\&")
+            fixes["ampersand"] = fixes.get("ampersand", 0) + 1
+            i += 1
+            continue
+        elif c == "#" and not line[i + 1:i + 2].isdigit():
+            out.append("\\#")
+            fixes["hash"] = fixes.get("hash", 0) + 1
+            i += 1
+            continue
+        elif c == "_" and not in_math:
+            out.append("\\_")
+            fixes["underscore"] = fixes.get("underscore", 0) + 1
+            i += 1
+            continue
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+        out.append(c)
+        i += 1
+    return "".join(out), depth
+
+def _repair_brace_balance(lines, nets, fixes):
+    total = sum(nets)
+    if total > 0:
+        # 🧩 Missing closers: close lines that open a group right before a new item/section/env
+        for n, net in enumerate(nets):
+            if total <= 0:
+                break
+            if net <= 0:
+                continue
+            following = next((l.strip() for l in lines[n + 1:] if l.strip()), "")
+            if not following or following.startswith(LATEX_LIST_CLOSERS):
+                add = min(net, total)
+                lines[n] = lines[n].rstrip() + "}" * add
+                nets[n] -= add
+                total -= add
+                fixes["brace"] = fixes.get("brace", 0) + add
+        # 🧩 Groups still open when their environment (or the body) ends are closed right there
+        depth, opened = 0, []
+        for n, line in enumerate(lines):
+            stripped = line.lstrip()
+            if stripped.startswith("\\end{") and opened:
+                add = min(depth - opened.pop(), total)
+                if add > 0:
+                    lines[n] = line[:len(line) - len(stripped)] + "}" * add + stripped
+                    depth -= add
+                    total -= add
+                    fixes["brace"] = fixes.get("brace", 0) + add
+            elif stripped.startswith("\\begin{") and "\\end{" not in stripped:
+                opened.append(depth)
+            depth += nets[n]
+        if total > 0 and depth > 0:
+            add = min(depth, total)
+            lines.append("}" * add)
+            total -= add
+            fixes["brace"] = fixes.get("brace", 0) + add
+    elif total < 0:
+        # 🧩 Stray closers: drop surplus trailing '}' on the lines that over-close
+        for n, net in enumerate(nets):
+            if total >= 0:
+                break
+            stripped = lines[n].rstrip()
+            while net < 0 and total < 0 and stripped.endswith("}") and not stripped.endswith("\\}"):
+                stripped = stripped[:-1]
+                net += 1
+                total += 1
+                fixes["brace"] = fixes.get("brace", 0) + 1
+            if stripped != lines[n].rstrip():
+                lines[n] = stripped
+    return total
+
+def lint_latex(latex_code):
+    fixes, errors = {}, []
+    text = latex_code or ""
+
+    if _fence_line_re.search(text):
+        fixes["markdown_fence"] = len(_fence_line_re.findall(text))
+        text = _fence_line_re.sub("", text)
+    text = text.strip("\n") + "\n"
+
+    match = _documentclass_re.search(text)
+    if match is None:
+        return {"latex": text, "fixes": fixes, "errors": ["missing \\documentclass"]}
+    if text[:match.start()].strip():
+        fixes["leading_text"] = 1
+        text = text[match.start():]
+
+    preamble, body = split_latex_preamble(text)
+    if preamble is None:
+        return {"latex": text, "fixes": fixes, "errors": ["missing \\begin{document}"]}
+    preamble_check = [re.sub(r"(?<!\\)%.*", "", l) for l in preamble.splitlines()]
+    preamble_balance = sum(l.count("{") - l.count("\\{") - l.count("}") + l.count("\\}") for l in preamble_check)
+    if preamble_balance:
+        errors.append(f"unbalanced braces in preamble ({preamble_balance:+d})")
+
+    end_match = _document_end_re.search(body)
+    tail = ""
+    if end_match is None:
+        fixes["missing_end_document"] = 1
+        # ✂️ A truncated reply usually stops mid-line; drop a last line cut inside a group or command
+        kept = body.rstrip().split("\n")
+        last = re.sub(r"(?<!\\)%.*", "", kept[-1])
+        if len(kept) > 1 and (last.count("{") != last.count("}") or re.search(r"(?<!\\)\\[a-zA-Z]*$", last.rstrip())):
+            fixes["truncated_line"] = 1
+            body = "\n".join(kept[:-1])
+    else:
+        body, tail = body[:end_match.start()], body[end_match.start():]
+
+    lines, nets, envs = body.split("\n"), [], []
+    for n, line in enumerate(lines):
+        lines[n], net = _lint_body_line(line, envs, fixes)
+        nets.append(net)
+
+    remaining = _repair_brace_balance(lines, nets, fixes)
+    if remaining:
+        errors.append(f"unbalanced braces in body ({remaining:+d})")
+
+    # 🧩 Close environments the model left open (usually a truncated reply)
+    open_envs = envs[1:] if envs[:1] == ["document"] else envs
+    if open_envs:
+        fixes["unclosed_env"] = len(open_envs)
+        lines.append("\n".join(f"\\end{{{name}}}" for name in reversed(open_envs)))
+    body = "\n".join(lines).rstrip() + "\n\n"
+    if not tail:
+        tail = "\\end{document}\n"
+
+    if not re.sub(r"\\begin\{document\}|%[^\n]*|\s", "", body):
+        errors.append("document body is empty")
+
+    return {"latex": preamble + body + tail, "fixes": fixes, "errors": errors}
+
+class LatexLintStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.repaired = 0
+        self.rejected = 0
+        self.compiles_avoided = 0
+        self.fixes = {}
+
+    def record(self, result, compile_avoided=False):
+        with self._lock:
+            self.documents += 1
+            if result["fixes"]:
+                self.repaired += 1
+            if result["errors"]:
+                self.rejected += 1
+            if compile_avoided:
+                self.compiles_avoided += 1
+            for kind, count in result["fixes"].items():
+                self.fixes[kind] = self.fixes.get(kind, 0) + count
+        for kind, count in result["fixes"].items():
+            metrics.inc("resume_latex_lint_fixes_total", count, help="LaTeX problems auto-repaired", kind=kind)
+        if compile_avoided:
+            metrics.inc("resume_latex_compiles_avoided_total", help="xelatex runs skipped for hopeless LaTeX")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "repaired": self.repaired,
+                "rejected": self.rejected,
+                "compiles_avoided": self.compiles_avoided,
+                "fixes": dict(self.fixes),
+            }
+
+latex_lint_stats = LatexLintStats()
+
+# ✅ Repair freshly generated LaTeX; hopeless output is kept as-is (and logged) for the caller to decide
+def repair_latex(latex_code, source="generated"):
+    with stage_timer("latex_lint"):
+        result = lint_latex(latex_code)
+    latex_lint_stats.record(result)
+    if result["fixes"]:
+        logging.info(f"🩹 Repaired {source} LaTeX: " + ", ".join(f"{k}×{v}" for k, v in result["fixes"].items()))
+    if result["errors"]:
+        logging.warning(f"⚠️ {source} LaTeX failed lint: " + "; ".join(result["errors"]))
+    return result
+
+UNCHANGED_LATEX_NOTE = "% Note: Gemini returned unchanged LaTeX"
+
 # ✅ Optimize resume for job based on feedback using Gemini
-def optimize_resume_for_job(model, latex_resume, job_description, feedback):
+def optimize_resume_for_job(model, latex_resume, job_description, feedback, on_token=None, sections=None):
     try:
         logging.info("🛠️ Optimizing resume for better job match...")
 
-        prompt = PROMPT_OPTIMIZER \
+        if SECTION_OPTIMIZE if sections is None else sections:
+            # 🧩 Regenerate only the sections the feedback flags, splice them back in place
+            spliced = optimize_flagged_sections(model, latex_resume, job_description, feedback, on_token=on_token)
+            if spliced is not None:
+                repaired = repair_latex(spliced, "spliced")
+                if repaired["errors"] and not lint_latex(latex_resume)["errors"]:
+                    logging.warning("⚠️ Spliced LaTeX is beyond repair; keeping the previous version.")
+                    return latex_resume
+                spliced = repaired["latex"].strip()
+                if spliced == latex_resume:
+                    logging.warning("⚠️ Gemini returned unchanged resume.")
+                    return latex_resume + "\n\n" + UNCHANGED_LATEX_NOTE
+                return spliced
+
+        prompt = templates.get("optimizer") \
             .replace("<LATEX_CODE>", latex_resume) \
             .replace("<JOB_DESCRIPTION>", job_description) \
             .replace("<FEEDBACK>", feedback)
 
-        response = model.generate_content(prompt)
+        response = generate_content(model, prompt, on_token=on_token, call="optimizer")
 
         if not response.text:
             logging.warning("⚠️ Gemini returned empty response for optimization.")
             return latex_resume  # fallback
 
-        new_latex = response.text.strip()
-
-        # Remove markdown if present
-        if new_latex.startswith("```latex") and new_latex.endswith("```"):
-            new_latex = new_latex.replace("```latex", "").replace("```", "").strip()
+        # 🧽 Strip markdown fences, escape stray specials, close dangling braces/environments
+        repaired = repair_latex(response.text.strip(), "optimized")
+        if repaired["errors"] and not lint_latex(latex_resume)["errors"]:
+            logging.warning("⚠️ Optimized LaTeX is beyond repair; keeping the previous version.")
+            return latex_resume
+        new_latex = repaired["latex"].strip()
 
         # Optional: prevent returning same as before
         if new_latex == latex_resume:
             logging.warning("⚠️ Gemini returned unchanged resume.")
-            return latex_resume + "\n\n% Note: Gemini returned unchanged LaTeX"
+            return latex_resume + "\n\n" + UNCHANGED_LATEX_NOTE
 
         return new_latex
 
@@ -322,26 +2737,245 @@ def optimize_resume_for_job(model, latex_resume, job_description, feedback):
         return latex_resume
 
 
+# ✅ LaTeX section parser: split a resume into addressable \section blocks
+SECTION_OPTIMIZE = os.environ.get("SECTION_OPTIMIZE", "").lower() in ("1", "true", "yes")
+
+_section_start_re = re.compile(r"^[ \t]*\\section\*?\{", re.MULTILINE)
+_document_end_re = re.compile(r"^[ \t]*\\end\{document\}", re.MULTILINE)
+_trailing_gap_re = re.compile(r"(?:\n[ \t]*(?:%[^\n]*)?)+\s*$")
+
+def _braced_argument(text, open_index):
+    depth = 0
+    for i in range(open_index, len(text)):
+        char = text[i]
+        if char == "\\":
+            continue
+        if char == "{" and text[i - 1] != "\\":
+            depth += 1
+        elif char == "}" and text[i - 1] != "\\":
+            depth -= 1
+            if depth == 0:
+                return text[open_index + 1:i]
+    return text[open_index + 1:]
+
+def split_latex_sections(latex_code):
+    # Blocks concatenate back to the exact original source:
+    #   head (preamble + anything before the first \section), then per section a
+    #   "section" block followed by its trailing blank/comment-only "gap", then the tail.
+    end_match = _document_end_re.search(latex_code)
+    body_end = end_match.start() if end_match else len(latex_code)
+    starts = [m.start() for m in _section_start_re.finditer(latex_code, 0, body_end)]
+    if not starts:
+        return [{"kind": "head", "title": None, "text": latex_code}]
+
+    blocks = [{"kind": "head", "title": None, "text": latex_code[:starts[0]]}]
+    for start, end in zip(starts, starts[1:] + [body_end]):
+        chunk = latex_code[start:end]
+        gap = _trailing_gap_re.search(chunk)
+        split_at = gap.start() if gap else len(chunk)
+        title = _braced_argument(chunk, chunk.index("{"))
+        blocks.append({"kind": "section", "title": title.strip(), "text": chunk[:split_at]})
+        if split_at < len(chunk):
+            blocks.append({"kind": "gap", "title": None, "text": chunk[split_at:]})
+    blocks.append({"kind": "tail", "title": None, "text": latex_code[body_end:]})
+    return blocks
+
+def join_latex_sections(blocks):
+    return "".join(block["text"] for block in blocks)
+
+SECTION_KEYWORDS = {
+    "summary": ("summary", "objective", "profile"),
+    "skills": ("skill", "certification", "technolog", "tools"),
+    "experience": ("experience", "employment", "work history", "achievement"),
+    "projects": ("project",),
+    "education": ("education", "academic", "coursework"),
+}
+
+def find_section_index(blocks, topic):
+    keywords = SECTION_KEYWORDS[topic]
+    for index, block in enumerate(blocks):
+        if block["kind"] == "section" and any(k in block["title"].lower() for k in keywords):
+            return index
+    return None
+
+_feedback_block_re = re.compile(r"^\s*-\s*\*\*([^*]+?):?\*\*:?(.*?)(?=^\s*-\s*\*\*|\Z)", re.MULTILINE | re.DOTALL)
+_actionable_re = re.compile(
+    r"\b(add|adding|missing|lack|lacks|lacking|improve|should|consider|weak|not|could|include|"
+    r"align|highlight|enhance|quantify|expand|strengthen|emphasi[sz]e|tailor|mention)\b", re.IGNORECASE)
+
+def sections_flagged_by_feedback(feedback):
+    flagged = set()
+    for label, content in _feedback_block_re.findall(feedback):
+        if "format" in label.lower() or not _actionable_re.search(content):
+            continue
+        text = f"{label} {content}".lower()
+        for topic, keywords in SECTION_KEYWORDS.items():
+            if any(k in text for k in keywords):
+                flagged.add(topic)
+    return flagged
+
+_section_marker_re = re.compile(r"%%% BEGIN SECTION (\d+)\s*\n(.*?)\n?%%% END SECTION \1", re.DOTALL)
+
+def optimize_flagged_sections(model, latex_resume, job_description, feedback, on_token=None):
+    # Returns the spliced LaTeX, or None when a whole-document rewrite is the better fit
+    section_prompt = templates.get("section_optimizer")
+    if not section_prompt:
+        return None
+    blocks = split_latex_sections(latex_resume)
+    section_count = sum(block["kind"] == "section" for block in blocks)
+    flagged = sections_flagged_by_feedback(feedback)
+    indexes = sorted({i for i in (find_section_index(blocks, topic) for topic in flagged) if i is not None})
+    if not indexes or len(indexes) >= section_count:
+        return None
+
+    logging.info(f"🧩 Optimizing {len(indexes)}/{section_count} flagged sections: "
+                 + ", ".join(blocks[i]["title"] for i in indexes))
+    sections_text = "\n\n".join(
+        f"%%% BEGIN SECTION {n}\n{blocks[i]['text'].strip()}\n%%% END SECTION {n}"
+        for n, i in enumerate(indexes, 1)
+    )
+    prompt = section_prompt \
+        .replace("<SECTIONS>", sections_text) \
+        .replace("<JOB_DESCRIPTION>", job_description) \
+        .replace("<FEEDBACK>", feedback)
+
+    response = generate_content(model, prompt, on_token=on_token, call="section_optimizer")
+    rewritten = {int(n): text.strip() for n, text in _section_marker_re.findall(response.text or "")}
+
+    for n, i in enumerate(indexes, 1):
+        new_text = rewritten.get(n, "")
+        # Only splice blocks that still look like the same section
+        if _section_start_re.match(new_text):
+            trailing = blocks[i]["text"][len(blocks[i]["text"].rstrip()):]
+            blocks[i]["text"] = new_text + trailing
+        else:
+            logging.warning(f"⚠️ Section {n} missing or malformed in Gemini output, keeping original")
+    return join_latex_sections(blocks)
+
+# ✅ Iterative optimize → evaluate loop with budgets and early stopping
+OPTIMIZE_MAX_ITERATIONS = _env_int("OPTIMIZE_MAX_ITERATIONS", 5)
+
+def _form_number(name, default, cast=float):
+    try:
+        value = request.form.get(name, "")
+        return cast(value) if value.strip() else default
+    except ValueError:
+        return default
+
+def optimize_until_converged(model, latex_resume, job_description, score, feedback,
+                             target_score=9, max_iterations=3, time_budget=None,
+                             token_budget=None, patience=1):
+    best = {"latex_code": latex_resume, "score": score, "feedback": feedback, "iteration": 0}
+    current_latex, current_feedback = latex_resume, feedback
+    trace = []
+    tokens_used = 0
+    stalls = 0
+    started = time.monotonic()
+    stop_reason = "max_iterations"
+
+    for iteration in range(1, max_iterations + 1):
+        if best["score"] >= target_score:
+            stop_reason = "target_reached"
+            break
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            stop_reason = "time_budget"
+            break
+        if token_budget is not None and tokens_used >= token_budget:
+            stop_reason = "token_budget"
+            break
+
+        iteration_started = time.monotonic()
+        with track_llm_usage() as usage:
+            new_latex = optimize_resume_for_job(model, current_latex, job_description, current_feedback)
+            unchanged = new_latex.replace(UNCHANGED_LATEX_NOTE, "").strip() == current_latex.strip()
+            if not unchanged:
+                new_score, new_feedback = evaluate_resume_job_match(model, new_latex, job_description)
+
+        tokens_used += usage.total_tokens
+        step = {
+            "iteration": iteration,
+            "score": None if unchanged else new_score,
+            "latency_ms": round((time.monotonic() - iteration_started) * 1000, 1),
+            "llm_calls": usage.calls,
+            "cached_calls": usage.cached_calls,
+            "prompt_tokens": usage.prompt_tokens,
+            "response_tokens": usage.response_tokens,
+        }
+        trace.append(step)
+
+        if unchanged:
+            stop_reason = "latex_unchanged"
+            break
+
+        if new_score > best["score"]:
+            best = {"latex_code": new_latex, "score": new_score, "feedback": new_feedback, "iteration": iteration}
+            stalls = 0
+        else:
+            stalls += 1
+        current_latex, current_feedback = new_latex, new_feedback
+
+        if best["score"] >= target_score:
+            stop_reason = "target_reached"
+            break
+        if stalls >= patience:
+            stop_reason = "plateau"
+            break
+
+    return {
+        "best": best,
+        "trace": trace,
+        "stop_reason": stop_reason,
+        "tokens_used": tokens_used,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+
 # ✅ Route to auto-optimize if needed
-@app.route("/optimize_resume", methods=["POST"])
+@bp.route("/optimize_resume", methods=["POST"])
 @login_required
 def optimize_resume():
     try:
         resume_id = request.form.get("resume_id")
-        if not resume_id or resume_id not in resume_store:
+        entry = resume_store.get(resume_id) if resume_id else None
+        if entry is None:
             return jsonify({"error": "Invalid resume ID"}), 400
 
-        entry = resume_store[resume_id]
-        model = default_model
-        if entry.get("api_key"):
-            genai.configure(api_key=entry["api_key"])
-            model = genai.GenerativeModel("gemini-1.5-flash")
+        model = model_for_key(resume_api_key(resume_id))
 
         score = entry.get("score", 0)
         feedback = entry.get("feedback", "")
         original_latex = entry.get("latex_code", "")
         job_description = entry.get("job_description", "")
 
+        if request.form.get("mode") == "iterative":
+            # 🔁 Server-side loop until target score / iteration / token / time budget
+            run = optimize_until_converged(
+                model, original_latex, job_description, score, feedback,
+                target_score=_form_number("target_score", 9),
+                max_iterations=max(1, min(_form_number("max_iterations", 3, int), OPTIMIZE_MAX_ITERATIONS)),
+                time_budget=_form_number("time_budget", None),
+                token_budget=_form_number("token_budget", None, int),
+                patience=max(1, _form_number("patience", 1, int)),
+            )
+            best = run["best"]
+            revision = record_revision(entry, best["latex_code"], "optimized_iterative")
+            entry["score"] = best["score"]
+            entry["feedback"] = best["feedback"]
+            resume_store[resume_id] = entry
+
+            return jsonify({
+                "message": f"Iterative optimization stopped: {run['stop_reason']}.",
+                "resume_id": resume_id,
+                "latex_code": best["latex_code"],
+                "score": best["score"],
+                "feedback": best["feedback"],
+                "best_iteration": best["iteration"],
+                "revision": revision,
+                "stop_reason": run["stop_reason"],
+                "tokens_used": run["tokens_used"],
+                "elapsed_ms": run["elapsed_ms"],
+                "trace": run["trace"]
+            }), 200
+
         if score >= 8:
             return jsonify({
                 "message": "Resume already has a good score. No optimization needed.",
@@ -349,21 +2983,34 @@ def optimize_resume():
                 "score": score
             }), 200
 
+        prescore = ats_prescore(original_latex, job_description)
+        if ats_gate_skips_llm(prescore):
+            ats_agreement.record_gated()
+            return jsonify({
+                "message": "Resume already matches the job keywords well. No optimization needed.",
+                "latex_code": original_latex,
+                "score": score,
+                "ats_prescore": prescore
+            }), 200
+
         # ✨ Optimize it
-        new_latex = optimize_resume_for_job(model, original_latex, job_description, feedback)
-        entry["latex_code"] = new_latex
+        new_latex = optimize_resume_for_job(model, original_latex, job_description, feedback,
+                                            sections=_form_flag("sections"))
+        revision = record_revision(entry, new_latex, "optimized")
 
         # 🔁 Re-evaluate
         new_score, new_feedback = evaluate_resume_job_match(model, new_latex, job_description)
         entry["score"] = new_score
         entry["feedback"] = new_feedback
+        resume_store[resume_id] = entry
 
         return jsonify({
             "message": "Resume optimized successfully.",
             "resume_id": resume_id,
             "latex_code": new_latex,
             "score": new_score,
-            "feedback": new_feedback
+            "feedback": new_feedback,
+            "revision": revision
         }), 200
 
     except Exception as e:
@@ -371,10 +3018,20 @@ def optimize_resume():
         return jsonify({"error": "Resume optimization failed"}), 500
 
 # ✅ Analyze resume skills vs job description using Gemini
-def analyze_skills(model, latex_resume, job_description):
+def analyze_skills(model, latex_resume, job_description, compact=None, recommend=True):
+    # ⚡ Taxonomy fast path; a resume it finds nothing in (non-tech roles) still goes to Gemini
+    if SKILLS_ANALYSIS != "llm" and skill_taxonomy.available():
+        skills_data = analyze_skills_local(model, latex_resume, job_description, recommend)
+        if skills_data["current_skills"] or not recommend:
+            return skills_data
+        skill_taxonomy.record("llm_fallbacks")
+        logging.info("🗂️ No taxonomy skills found in resume, using full Gemini analysis")
+
     try:
         logging.info("🧠 Analyzing skills and certifications...")
 
+        resume_text = resume_for_prompt(latex_resume, compact)
+
         analysis_prompt = f"""
 You are a resume analyzer. Extract and evaluate skills from the given LaTeX resume and compare them with the job description.
 
@@ -398,13 +3055,14 @@ RECOMMENDED_SKILLS:
 RECOMMENDED_CERTIFICATIONS:
 
 Resume:
-{latex_resume}
+{resume_text}
 
 Job Description:
 {job_description}
 """
+        prompt_size_stats.record("skills_analysis", analysis_prompt, latex_resume, resume_text)
 
-        response = model.generate_content(analysis_prompt)
+        response = generate_content(model, analysis_prompt, call="skills_analysis")
 
         if not response.text:
             return {
@@ -416,7 +3074,8 @@ Job Description:
                 "latex_skills_section": ""
             }
 
-        return parse_skills_response(response.text.strip())
+        with stage_timer("parse_skills"):
+            return parse_skills_response(response.text.strip())
 
     except Exception as e:
         logging.warning(f"⚠️ Skill analysis failed: {e}")
@@ -472,23 +3131,513 @@ def parse_skills_response(response_text):
     }
 
 
+# ✅ Local skills taxonomy: every skill / certification name and alias in one Aho-Corasick automaton
+SKILLS_TAXONOMY_PATH = os.environ.get("SKILLS_TAXONOMY_PATH") or os.path.join(BASE_DIR, "skills_taxonomy.json")
+SKILLS_ANALYSIS = os.environ.get("SKILLS_ANALYSIS", "taxonomy").lower()  # "llm" = whole analysis by Gemini
+
+_whitespace_re = re.compile(r"\s+")
+_STRICT_BOUNDARY = frozenset(" ,;:()[]{}|")
+
+class AhoCorasick:
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern, value):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), value))
+
+    def build(self):
+        # Breadth-first: a state's failure link always points at a shallower, finished state
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in self._goto[state].items():
+                pending.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    @property
+    def states(self):
+        return len(self._goto)
+
+    def finditer(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in out[state]:
+                yield index + 1 - length, index + 1, value
+
+def _normalize_for_match(text):
+    # Same length in and out, so offsets found in the lowered copy index the original
+    text = _whitespace_re.sub(" ", text)
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+    return text, lowered
+
+def _is_boundary(text, index, strict):
+    if index < 0 or index >= len(text):
+        return True
+    ch = text[index]
+    if strict:
+        return ch in _STRICT_BOUNDARY
+    return not ch.isalnum() and ch != "&"
+
+class SkillTaxonomy:
+    def __init__(self, path, reload_interval):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._mtime = None
+        self._matcher = None
+        self.categories = []
+        self.version = None
+        self.terms = 0
+        self.load_ms = 0.0
+        self.error = None
+        self.reloads = 0
+        self.analyses = 0
+        self.match_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_fallbacks = 0
+
+    def _compile(self, data):
+        matcher = AhoCorasick()
+        terms = 0
+
+        def add_entry(canonical, aliases, kind, category):
+            nonlocal terms
+            names = [str(a).strip() for a in aliases if str(a).strip()]
+            if "=" + canonical not in names:
+                names.append(canonical)
+            for name in names:
+                case_sensitive = name.startswith("=")
+                name = _whitespace_re.sub(" ", name[1:] if case_sensitive else name)
+                # Single-character names ("C", "R") only count as standalone tokens
+                matcher.add(name.lower(), (canonical, kind, category, name if case_sensitive else None, len(name) == 1))
+                terms += 1
+
+        for category, skills in data.get("skills", {}).items():
+            for canonical, aliases in skills.items():
+                add_entry(canonical, aliases, "skill", category)
+        for canonical, aliases in data.get("certifications", {}).items():
+            add_entry(canonical, aliases, "certification", "Certifications")
+        if not terms:
+            raise ValueError(f"{self.path} defines no skills or certifications")
+        return matcher.build(), list(data.get("skills", {})), terms
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._matcher is not None and (not self.reload_interval or now - self._checked_at < self.reload_interval):
+                return
+            self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            started = time.perf_counter()
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            matcher, categories, terms = self._compile(data)
+        except (OSError, ValueError) as e:
+            if self.error != str(e):
+                logging.warning(f"⚠️ Skills taxonomy not loaded from {self.path}: {e}")
+            self.error = str(e)
+            return
+        with self._lock:
+            reloaded = self._matcher is not None
+            self._matcher, self.categories, self.terms, self._mtime = matcher, categories, terms, mtime
+            self.version = data.get("version")
+            self.load_ms = (time.perf_counter() - started) * 1000
+            self.error = None
+            if reloaded:
+                self.reloads += 1
+        logging.info(f"🗂️ Skills taxonomy loaded: {terms} terms, {matcher.states} states in {self.load_ms:.1f} ms")
+
+    def available(self):
+        self._maybe_reload()
+        return self._matcher is not None
+
+    def find(self, text):
+        # Leftmost-longest: "C++" beats "C", "Node.js" beats "Node", "PL/SQL" beats "SQL"
+        self._maybe_reload()
+        matcher = self._matcher
+        if matcher is None or not text:
+            return OrderedDict()
+        started = time.perf_counter()
+        original, lowered = _normalize_for_match(text)
+        candidates = []
+        for start, end, (canonical, kind, category, exact, strict) in matcher.finditer(lowered):
+            if exact is not None and original[start:end] != exact:
+                continue
+            if not (_is_boundary(lowered, start - 1, strict) and _is_boundary(lowered, end, strict)):
+                continue
+            candidates.append((start, -end, canonical, kind, category))
+        candidates.sort()
+
+        found = OrderedDict()
+        taken_until = 0
+        for start, neg_end, canonical, kind, category in candidates:
+            if start < taken_until:
+                continue
+            taken_until = -neg_end
+            found.setdefault(canonical, (kind, category))
+        with self._lock:
+            self.match_seconds += time.perf_counter() - started
+        return found
+
+    def record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def fingerprint(self):
+        # Part of every job profile key: editing the taxonomy re-extracts postings on next sight
+        self._maybe_reload()
+        return f"{self.version}:{self._mtime}"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": os.path.relpath(self.path, BASE_DIR),
+                "version": self.version,
+                "terms": self.terms,
+                "states": self._matcher.states if self._matcher else 0,
+                "load_ms": round(self.load_ms, 2),
+                "error": self.error,
+                "reloads": self.reloads,
+                "analyses": self.analyses,
+                "llm_calls": self.llm_calls,
+                "llm_fallbacks": self.llm_fallbacks,
+                "match_ms_total": round(self.match_seconds * 1000, 2),
+            }
+
+skill_taxonomy = SkillTaxonomy(SKILLS_TAXONOMY_PATH, TEMPLATE_RELOAD_INTERVAL)
+
+_skill_line_re = re.compile(r"^[-*\s]*([^:\n]{1,40}):\s*(.+)$", re.MULTILINE)
+
+def listed_resume_skills(blocks):
+    # The resume's own skills section, category by category, so regenerating it never drops a skill
+    index = find_section_index(blocks, "skills")
+    listed, certifications = OrderedDict(), []
+    if index is None:
+        return listed, certifications
+    for category, items in _skill_line_re.findall(latex_to_text(blocks[index]["text"])):
+        values = [v.strip() for v in re.split(r",|;", items) if v.strip()]
+        if "certif" in category.lower():
+            certifications += [v for v in values if v.lower() != "no current certifications"]
+        elif values:
+            listed.setdefault(category.strip(), []).extend(values)
+    return listed, certifications
+
+def _by_category(names, hits):
+    grouped = OrderedDict()
+    for name in names:
+        grouped.setdefault(hits[name][1], []).append(name)
+    return grouped
+
+def _canonical_key(name):
+    hits = skill_taxonomy.find(name)
+    return next(iter(hits)) if hits else name.strip().lower()
+
+def _merge_names(base, extra, held=()):
+    # Dedupe by canonical name, so "CKA" and "Certified Kubernetes Administrator (CKA)" count once
+    seen = {_canonical_key(name) for name in held}
+    merged = []
+    for name in list(base) + list(extra):
+        key = _canonical_key(name)
+        if key not in seen:
+            seen.add(key)
+            merged.append(name)
+    return merged
+
+def local_skills_analysis(latex_resume, job_description):
+    blocks = split_latex_sections(latex_resume)
+    listed, listed_certs = listed_resume_skills(blocks)
+    # Sections only: the header's "GitHub" / "LinkedIn" link text is not a skill
+    resume_hits = skill_taxonomy.find("\n".join(latex_to_text(b["text"]) for b in blocks if b["kind"] == "section"))
+    profile = job_profiles.get(job_description)
+    job_hits = OrderedDict((name, ("skill", category)) for name, category in profile["required_skills"])
+    job_hits.update((name, ("certification", "Certifications")) for name in profile["required_certifications"])
+
+    # 🧩 Keep the resume's own categories. A skill only mentioned elsewhere joins the resume category
+    # that already holds most skills of its taxonomy category, or a new one named after it
+    listed_canonical = OrderedDict()
+    home = {}
+    for category, items in listed.items():
+        counts = {}
+        for canonical, (_, taxonomy_category) in skill_taxonomy.find("\n".join(items)).items():
+            listed_canonical[canonical] = category
+            counts[taxonomy_category] = counts.get(taxonomy_category, 0) + 1
+        for taxonomy_category, count in counts.items():
+            if count > home.get(taxonomy_category, ("", 0))[1]:
+                home[taxonomy_category] = (category, count)
+    listed_canonical.update(skill_taxonomy.find("\n".join(listed_certs)))
+
+    current_by_category = OrderedDict((category, list(items)) for category, items in listed.items())
+    for canonical, (kind, category) in resume_hits.items():
+        if kind == "skill" and canonical not in listed_canonical:
+            current_by_category.setdefault(home.get(category, (category,))[0], []).append(canonical)
+    current_certs = listed_certs + [name for name, (kind, _) in resume_hits.items()
+                                    if kind == "certification" and name not in listed_canonical]
+
+    job_skills = [name for name, (kind, _) in job_hits.items() if kind == "skill"]
+    matched = [name for name in job_skills if name in resume_hits]
+    missing = [name for name in job_skills if name not in resume_hits]
+    job_certs = [name for name, (kind, _) in job_hits.items() if kind == "certification" and name not in resume_hits]
+
+    return {
+        "profession_type": "",
+        "current_skills": sum(current_by_category.values(), []),
+        "missing_skills": missing,
+        "recommended_skills": list(missing),
+        "matched_skills": matched,
+        "current_skills_by_category": current_by_category,
+        "matched_skills_by_category": _by_category(matched, job_hits),
+        "missing_skills_by_category": _by_category(missing, job_hits),
+        "recommended_skills_by_category": {},
+        "current_certifications": _merge_names(current_certs, []),
+        "recommended_certifications": job_certs,
+        "latex_skills_section": "",
+        "analysis_source": "taxonomy",
+        "job_profile": job_profile_summary(profile)
+    }
+
+def recommend_skills(model, skills_data, latex_resume, job_description):
+    # 🧠 Only the open-ended part goes to Gemini: no resume, just the extracted lists + the posting
+    prompt = f"""
+You are a career advisor. A resume's skills were already extracted and compared with a job description.
+
+Current skills: {", ".join(skills_data["current_skills"]) or "none found"}
+Current certifications: {", ".join(skills_data["current_certifications"]) or "none"}
+Skills the job asks for that the resume lacks: {", ".join(skills_data["missing_skills"]) or "none"}
+
+Recommend further skills and certifications that would make this candidate stronger for the job.
+Do not repeat current skills or certifications.
+
+Return result in this format:
+PROFESSION_TYPE:
+RECOMMENDED_SKILLS:
+RECOMMENDED_CERTIFICATIONS:
+
+Job Description:
+{job_description}
+"""
+    prompt_size_stats.record("skills_recommendation", prompt, latex_resume, "")
+    response = generate_content(model, prompt, call="skills_recommendation")
+    with stage_timer("parse_skills"):
+        return parse_skills_response((response.text or "").strip())
+
+def analyze_skills_local(model, latex_resume, job_description, recommend=True):
+    with stage_timer("skills_taxonomy"):
+        skills_data = local_skills_analysis(latex_resume, job_description)
+    skill_taxonomy.record("analyses")
+    if not recommend or model is None:
+        return skills_data
+
+    try:
+        llm = recommend_skills(model, skills_data, latex_resume, job_description)
+    except Exception as e:
+        # The local analysis already holds the missing skills — serve it rather than an error
+        logging.warning(f"⚠️ Skill recommendations failed, returning taxonomy results only: {e}")
+        return skills_data
+    skill_taxonomy.record("llm_calls")
+
+    skills_data.update({
+        "profession_type": llm["profession_type"],
+        "recommended_skills": _merge_names(skills_data["missing_skills"], llm["recommended_skills"],
+                                           held=skills_data["current_skills"]),
+        "recommended_certifications": _merge_names(skills_data["recommended_certifications"],
+                                                   llm["recommended_certifications"],
+                                                   held=skills_data["current_certifications"]),
+        "analysis_source": "taxonomy+llm"
+    })
+    return skills_data
+
+# ✅ Fused evaluation + skills analysis in one structured-JSON Gemini call
+FUSED_ANALYSIS_MAX_ATTEMPTS = _env_int("FUSED_ANALYSIS_MAX_ATTEMPTS", 2)
+
+FEEDBACK_LABELS = [
+    ("job_match", "Job Match"),
+    ("skills_relevance", "Skills Relevance"),
+    ("project_alignment", "Project Alignment"),
+    ("experience_achievements", "Experience & Achievements"),
+    ("formatting", "Formatting"),
+    ("missing_elements", "Missing Elements"),
+    ("suggestions", "Suggestions for Improvement"),
+]
+SKILL_LIST_FIELDS = ("current_certifications", "missing_skills", "recommended_skills", "recommended_certifications")
+
+class AnalysisFormatError(ValueError):
+    pass
+
+def _string_list(value, field):
+    if isinstance(value, str):
+        value = [v for v in re.split(r",|\n", value)]
+    if not isinstance(value, list):
+        raise AnalysisFormatError(f"{field} must be a list")
+    return [str(v).strip() for v in value if str(v).strip()]
+
+def parse_fused_analysis(text):
+    # Single pass: locate the JSON object, decode it, validate against the schema
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise AnalysisFormatError("no JSON object in response")
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise AnalysisFormatError(f"invalid JSON: {e}")
+    if not isinstance(data, dict):
+        raise AnalysisFormatError("top level must be an object")
+
+    try:
+        score = int(round(float(data.get("score"))))
+    except (TypeError, ValueError):
+        raise AnalysisFormatError("score must be a number")
+    if not 0 <= score <= 10:
+        raise AnalysisFormatError("score must be between 0 and 10")
+
+    feedback_data = data.get("feedback")
+    if isinstance(feedback_data, str):
+        feedback = feedback_data.strip()
+    elif isinstance(feedback_data, dict):
+        parts = [f"Score: {score}/10", "", "Feedback:"]
+        for key, label in FEEDBACK_LABELS:
+            value = feedback_data.get(key)
+            if not value:
+                continue
+            if isinstance(value, list):
+                parts.append(f"- **{label}:**\n" + "\n".join(f"  - {v}" for v in _string_list(value, key)))
+            else:
+                parts.append(f"- **{label}:** {str(value).strip()}")
+            parts.append("")
+        feedback = "\n".join(parts).strip()
+    else:
+        raise AnalysisFormatError("feedback must be an object or string")
+
+    skills = data.get("skills")
+    if not isinstance(skills, dict):
+        raise AnalysisFormatError("skills must be an object")
+    by_category = skills.get("current_skills_by_category") or {}
+    if not isinstance(by_category, dict):
+        raise AnalysisFormatError("current_skills_by_category must be an object")
+    by_category = {str(k).strip(): _string_list(v, k) for k, v in by_category.items()}
+    lists = {field: _string_list(skills.get(field) or [], field) for field in SKILL_LIST_FIELDS}
+
+    skills_data = {
+        "profession_type": str(skills.get("profession_type") or "").strip(),
+        "current_skills": sum(by_category.values(), []),
+        "missing_skills": lists["missing_skills"],
+        "recommended_skills": lists["recommended_skills"],
+        "current_skills_by_category": by_category,
+        "recommended_skills_by_category": {},
+        "current_certifications": lists["current_certifications"],
+        "recommended_certifications": lists["recommended_certifications"],
+        "latex_skills_section": ""
+    }
+    return score, enforce_line_breaks(feedback), skills_data
+
+def analyze_resume_fused(model, latex_resume, job_description, compact=None):
+    fused_prompt = templates.get("fused_analyzer")
+    if not fused_prompt:
+        raise AnalysisFormatError("fused analyzer prompt not loaded")
+
+    resume_text = resume_for_prompt(latex_resume, compact)
+    base_prompt = fused_prompt \
+        .replace("<LATEX_CODE>", resume_text) \
+        .replace("<JOB_DESCRIPTION>", job_description)
+    prompt_size_stats.record("fused_analysis", base_prompt, latex_resume, resume_text)
+    generation_config = {"response_mime_type": "application/json"}
+
+    prompt, last_error = base_prompt, None
+    for attempt in range(1, FUSED_ANALYSIS_MAX_ATTEMPTS + 1):
+        response = generate_content(model, prompt, use_cache=attempt == 1, generation_config=generation_config,
+                                    call="fused_analysis")
+        try:
+            with stage_timer("parse_analysis"):
+                return parse_fused_analysis(response.text or "")
+        except AnalysisFormatError as e:
+            last_error = e
+            # Never keep serving a malformed reply from the cache
+            llm_cache.delete(llm_cache_key(model, prompt, generation_config))
+            logging.warning(f"⚠️ Fused analysis attempt {attempt} malformed: {e}")
+            prompt = (base_prompt + f"\n\nYour previous reply was rejected ({e}). "
+                      "Return ONLY the JSON object in exactly the requested shape.")
+    raise last_error
+
+@bp.route("/analyze_resume", methods=["POST"])
+@login_required
+def analyze_resume_route():
+    try:
+        resume_id = request.form.get("resume_id")
+        entry = resume_store.get(resume_id) if resume_id else None
+        if entry is None:
+            return jsonify({"error": "Invalid resume ID"}), 400
+
+        model = model_for_key(resume_api_key(resume_id))
+        compact = _form_flag("compact")
+
+        try:
+            score, feedback, skills_data = analyze_resume_fused(model, entry["latex_code"], entry["job_description"], compact)
+            fused = True
+        except AnalysisFormatError:
+            # 🔁 Fall back to the separate evaluate + skills calls
+            score, feedback = evaluate_resume_job_match(model, entry["latex_code"], entry["job_description"], compact)
+            skills_data = analyze_skills(model, entry["latex_code"], entry["job_description"], compact)
+            fused = False
+
+        entry["score"] = score
+        entry["feedback"] = feedback
+        entry["skills_analysis"] = skills_data
+        resume_store[resume_id] = entry
+
+        return jsonify({
+            "resume_id": resume_id,
+            "score": score,
+            "feedback": feedback,
+            "skills_analysis": skills_data,
+            "fused": fused
+        }), 200
+
+    except Exception as e:
+        logging.exception("❌ Error in analyze_resume_route")
+        return jsonify({"error": "Resume analysis failed"}), 500
+
 # ✅ Analyze skills route
-@app.route("/analyze_skills", methods=["POST"])
+@bp.route("/analyze_skills", methods=["POST"])
 @login_required
 def analyze_skills_route():
     try:
         resume_id = request.form.get("resume_id")
-        if not resume_id or resume_id not in resume_store:
+        entry = resume_store.get(resume_id) if resume_id else None
+        if entry is None:
             return jsonify({"error": "Invalid resume ID"}), 400
 
-        entry = resume_store[resume_id]
-        model = default_model
-        if entry.get("api_key"):
-            genai.configure(api_key=entry["api_key"])
-            model = genai.GenerativeModel("gemini-1.5-flash")
+        model = model_for_key(resume_api_key(resume_id))
 
-        skills_data = analyze_skills(model, entry["latex_code"], entry["job_description"])
-        resume_store[resume_id]["skills_analysis"] = skills_data
+        skills_data = analyze_skills(model, entry["latex_code"], entry["job_description"],
+                                     compact=_form_flag("compact"), recommend=_form_flag("local") is not True)
+        entry["skills_analysis"] = skills_data
+        resume_store[resume_id] = entry
 
         return jsonify({
             "resume_id": resume_id,
@@ -503,10 +3652,11 @@ def analyze_skills_route():
 
 
 # ✅ Generate summary page (page 1)
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import simpleSplit
-
 def create_summary_pdf(score, feedback, optimization_note, company_name):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import simpleSplit
+
     packet = io.BytesIO()
     c = canvas.Canvas(packet, pagesize=A4)
     width, height = A4
@@ -549,80 +3699,562 @@ def create_summary_pdf(score, feedback, optimization_note, company_name):
     return packet
 
 
-# ✅ Compile LaTeX to PDF
-def compile_latex_to_pdf(latex_code):
+# ✅ Precompiled preamble format (mylatexformat-style fast compile)
+LATEX_FAST_COMPILE = os.environ.get("LATEX_FAST_COMPILE", "").lower() in ("1", "true", "yes")
+LATEX_FORMAT_DIR = os.environ.get("LATEX_FORMAT_DIR") or os.path.join(tempfile.gettempdir(), "resume_latex_formats")
+_format_lock = threading.Lock()  # guards _format_state only; dumps run outside it
+_format_state = {}  # format name -> True (built) / False (build failed) / "building"
+
+def split_latex_preamble(latex_code):
+    marker = latex_code.find("\\begin{document}")
+    if marker == -1:
+        return None, latex_code
+    return latex_code[:marker], latex_code[marker:]
+
+def normalize_preamble(preamble):
+    lines = []
+    for line in preamble.splitlines():
+        line = re.sub(r"(?<!\\)%.*", "", line).strip()
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+def template_format_name():
+    preamble, _ = split_latex_preamble(templates.get("latex_template"))
+    if not preamble:
+        return None
+    digest = hashlib.sha256(normalize_preamble(preamble).encode("utf-8")).hexdigest()
+    return f"resume_{digest[:12]}"
+
+# ✅ Bounded xelatex scheduler: fixed worker pool, bounded queue, wall-clock + memory limits
+LATEX_COMPILE_WORKERS = _env_int("LATEX_COMPILE_WORKERS", os.cpu_count() or 2)
+LATEX_COMPILE_MAX_QUEUE = _env_int("LATEX_COMPILE_MAX_QUEUE", LATEX_COMPILE_WORKERS * 4)
+LATEX_COMPILE_TIMEOUT = _env_float("LATEX_COMPILE_TIMEOUT", 60)
+LATEX_COMPILE_MEMORY_MB = _env_int("LATEX_COMPILE_MEMORY_MB", 2048)  # 0 = no limit
+
+class CompileQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Too many PDF compiles in progress, please retry shortly.")
+        self.retry_after = retry_after
+
+class CompileScheduler:
+    def __init__(self, workers, max_queue):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="xelatex")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._recent = deque(maxlen=50)  # recent compile durations, for Retry-After
+
+    def retry_after(self):
+        with self._lock:
+            average = sum(self._recent) / len(self._recent) if self._recent else LATEX_COMPILE_TIMEOUT / 4
+            backlog = self.queued + self.running
+        return max(1, int(average * backlog / self.workers + 0.5))
+
+    def run(self, fn, *args):
+        # 🚦 Admission control: reject instead of piling up xelatex processes
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                rejected = True
+            else:
+                self.queued += 1
+                self.submitted += 1
+                rejected = False
+        if rejected:
+            metrics.inc("resume_compile_rejected_total", help="Compiles rejected because the queue was full")
+            raise CompileQueueFull(self.retry_after())
+
+        submitted_at = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            metrics.observe("resume_compile_queue_seconds", started - submitted_at,
+                            help="Time a compile waited for a worker")
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.observe("resume_compile_seconds", elapsed, help="xelatex compile time (excluding queue wait)")
+                with self._lock:
+                    self.running -= 1
+                    self._recent.append(elapsed)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        return self._executor.submit(task).result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_compile_seconds": round(sum(self._recent) / len(self._recent), 3) if self._recent else 0.0,
+            }
+
+compile_scheduler = CompileScheduler(LATEX_COMPILE_WORKERS, LATEX_COMPILE_MAX_QUEUE)
+
+def _run_xelatex(args, cwd, env=None, deadline=None):
+    # ⏱️ deadline (time.monotonic) is shared by every xelatex run of one compile request
+    timeout = LATEX_COMPILE_TIMEOUT if deadline is None else deadline - time.monotonic()
+    command = ["xelatex", "-interaction=nonstopmode"] + args
+    if LATEX_COMPILE_MEMORY_MB:
+        # 🧱 ulimit in a tiny shell wrapper (preexec_fn isn't safe with threads); exec keeps one process
+        limits = f"ulimit -v {LATEX_COMPILE_MEMORY_MB * 1024} && ulimit -t {int(max(timeout, 0)) + 1}"
+        command = ["sh", "-c", limits + ' && exec "$0" "$@"'] + command
+    try:
+        if timeout <= 0:
+            raise subprocess.TimeoutExpired(command, 0)
+        return subprocess.run(command, cwd=cwd, capture_output=True, text=True, env=env, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        metrics.inc("resume_compile_timeouts_total", help="xelatex runs killed at LATEX_COMPILE_TIMEOUT")
+        logging.error(f"⏱️ xelatex killed: compile exceeded {LATEX_COMPILE_TIMEOUT:g}s")
+        raise
+
+def _format_env():
+    env = dict(os.environ)
+    # Trailing separator keeps the default TeX format search path
+    env["TEXFORMATS"] = LATEX_FORMAT_DIR + os.pathsep + env.get("TEXFORMATS", "")
+    return env
+
+def ensure_preamble_format(name, preamble, deadline=None):
+    # 🔐 One dump per format: the first caller builds it, concurrent callers full-compile meanwhile
+    with _format_lock:
+        state = _format_state.get(name)
+        if state is not None:
+            return state is True
+        os.makedirs(LATEX_FORMAT_DIR, exist_ok=True)
+        if os.path.exists(os.path.join(LATEX_FORMAT_DIR, f"{name}.fmt")):
+            _format_state[name] = True
+            return True
+        _format_state[name] = "building"
+
+    logging.info(f"🧱 Dumping precompiled LaTeX preamble format {name}")
+    state = None  # stays None on a timeout or error so a later compile retries the dump
     try:
         with tempfile.TemporaryDirectory() as tmpdir:
-            tex_path = os.path.join(tmpdir, "resume.tex")
-            with open(tex_path, "w", encoding="utf-8") as f:
-                f.write(latex_code)
+            src_path = os.path.join(tmpdir, "preamble.tex")
+            with open(src_path, "w", encoding="utf-8") as f:
+                f.write(preamble + "\\begin{document}\n\\end{document}\n")
+
+            result = _run_xelatex(["-ini", f"-jobname={name}", "&xelatex", "mylatexformat.ltx", src_path],
+                                  cwd=tmpdir, deadline=deadline)
+
+            fmt_path = os.path.join(tmpdir, f"{name}.fmt")
+            if os.path.exists(fmt_path):
+                os.replace(fmt_path, os.path.join(LATEX_FORMAT_DIR, f"{name}.fmt"))
+                state = True
+            else:
+                logging.error("❌ Preamble format dump failed:\n" + result.stdout + "\n" + result.stderr)
+                state = False
+    finally:
+        with _format_lock:
+            if state is None:
+                _format_state.pop(name, None)
+            else:
+                _format_state[name] = state
+    return state
+
+def _compile_with_preamble_format(latex_code, deadline=None):
+    preamble, body = split_latex_preamble(latex_code)
+    name = template_format_name()
+    if not preamble or not name:
+        return None
 
-            result = subprocess.run(
-                ["xelatex", "-interaction=nonstopmode", tex_path],
-                cwd=tmpdir, capture_output=True, text=True
-            )
+    # Only the shared template preamble is precompiled; anything else compiles normally
+    template_preamble, _ = split_latex_preamble(templates.get("latex_template"))
+    if normalize_preamble(preamble) != normalize_preamble(template_preamble):
+        return None
+    if not ensure_preamble_format(name, template_preamble, deadline):
+        return None
 
-            pdf_path = os.path.join(tmpdir, "resume.pdf")
-            if not os.path.exists(pdf_path):
-                # ✅ Log error output for debugging
-                logging.error("❌ LaTeX Compilation Error:\n" + result.stdout + "\n" + result.stderr)
-                return None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tex_path = os.path.join(tmpdir, "resume.tex")
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(body)
 
-            with open(pdf_path, "rb") as f:
-                return io.BytesIO(f.read())
+        result = _run_xelatex([f"-fmt={name}", tex_path], cwd=tmpdir, env=_format_env(), deadline=deadline)
 
-    except Exception as e:
-        logging.error(f"❌ LaTeX PDF generation failed: {e}")
+        pdf_path = os.path.join(tmpdir, "resume.pdf")
+        if not os.path.exists(pdf_path):
+            logging.warning("⚠️ Fast compile failed, falling back to full compile:\n" + result.stdout[-2000:])
+            return None
+
+        with open(pdf_path, "rb") as f:
+            return f.read()
+
+def _compile_latex_full(latex_code, deadline=None):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tex_path = os.path.join(tmpdir, "resume.tex")
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(latex_code)
+
+        result = _run_xelatex([tex_path], cwd=tmpdir, deadline=deadline)
+
+        pdf_path = os.path.join(tmpdir, "resume.pdf")
+        if not os.path.exists(pdf_path):
+            # ✅ Log error output for debugging
+            logging.error("❌ LaTeX Compilation Error:\n" + result.stdout + "\n" + result.stderr)
+            return None
+
+        with open(pdf_path, "rb") as f:
+            return f.read()
+
+# ✅ Compile LaTeX to PDF
+def compile_latex_to_pdf(latex_code, fast=None):
+    # ♻️ Identical LaTeX source compiles to the same PDF — skip xelatex on a hit
+    cache_key = hashlib.sha256(latex_code.encode("utf-8")).hexdigest()
+    cached_pdf = pdf_cache.get(cache_key)
+    if cached_pdf is not None:
+        logging.info("♻️ Compiled PDF served from cache")
+        return io.BytesIO(cached_pdf)
+
+    if fast is None:
+        fast = LATEX_FAST_COMPILE
+
+    # 🩺 Reject documents xelatex can't possibly compile without spawning it
+    with stage_timer("latex_lint"):
+        lint = lint_latex(latex_code)
+    if lint["errors"]:
+        latex_lint_stats.record(lint, compile_avoided=True)
+        logging.error("❌ LaTeX rejected before compile: " + "; ".join(lint["errors"]))
         return None
+    if lint["fixes"]:
+        latex_lint_stats.record(lint)
+        logging.info("🩹 Compiling repaired LaTeX: " + ", ".join(f"{k}×{v}" for k, v in lint["fixes"].items()))
+        latex_code = lint["latex"]
 
-# ✅ Serve combined final PDF (auto download)
-@app.route("/download_pdf/<resume_id>", methods=["GET"])
-@login_required
-def download_pdf(resume_id):
-    try:
-        # ✅ Validate resume existence
-        if resume_id not in resume_store:
-            return "Invalid resume ID", 404
+    def compile_once():
+        # ⏱️ Fast attempt + full fallback share one LATEX_COMPILE_TIMEOUT budget per scheduler slot
+        deadline = time.monotonic() + LATEX_COMPILE_TIMEOUT
+        pdf = _compile_with_preamble_format(latex_code, deadline) if fast else None
+        return pdf if pdf is not None else _compile_latex_full(latex_code, deadline)
 
-        data = resume_store[resume_id]
+    try:
+        with stage_timer("latex_compile"):
+            pdf_bytes = compile_scheduler.run(compile_once)
+        metrics.inc("resume_latex_compiles_total", help="xelatex compile attempts",
+                    mode="fast" if fast else "full", result="ok" if pdf_bytes else "failed")
+        if pdf_bytes is None:
+            return None
+
+        pdf_cache.set(cache_key, pdf_bytes)
+        return io.BytesIO(pdf_bytes)
+
+    except CompileQueueFull:
+        raise
+    except Exception as e:
+        logging.error(f"❌ LaTeX PDF generation failed: {e}")
+        return None
 
-        # ✅ Create summary PDF (first page)
+# ✅ Everything that ends up in the downloaded PDF — any edit gives a new version
+FINAL_PDF_FIELDS = ("latex_code", "score", "feedback", "optimization_message", "company_name")
+
+def final_pdf_version(data):
+    digest = hashlib.sha256()
+    for field in FINAL_PDF_FIELDS:
+        digest.update(json.dumps(data.get(field), sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or f'"{etag}"' in candidates or f'W/"{etag}"' in candidates
+
+# ✅ Summary page + compiled resume → one PDF. Plain bytes in and out, so it can run in a worker process
+def merge_final_pdf(score, feedback, optimization_note, company_name, resume_pdf_bytes):
+    # ✅ Create summary PDF (first page)
+    with stage_timer("summary_pdf"):
         summary_pdf = create_summary_pdf(
-            score=data.get("score", 0),
-            feedback=data.get("feedback", "No feedback available."),
-            optimization_note=data.get("optimization_message", ""),
-            company_name=data.get("company_name", "")
+            score=score,
+            feedback=feedback,
+            optimization_note=optimization_note,
+            company_name=company_name
         )
 
-        # ✅ Create resume PDF (second page onward)
-        latex_code = data.get("latex_code", "")
-        resume_pdf = compile_latex_to_pdf(latex_code)
-        if not resume_pdf:
-            return "Failed to compile resume LaTeX.", 500
-
-        # ✅ Merge summary + resume into one PDF
+    # ✅ Merge summary + resume into one PDF
+    with stage_timer("pdf_merge"):
+        from PyPDF2 import PdfMerger
         merger = PdfMerger()
         merger.append(summary_pdf)
-        merger.append(resume_pdf)
+        merger.append(io.BytesIO(resume_pdf_bytes))
 
         final_pdf = io.BytesIO()
         merger.write(final_pdf)
         merger.close()
-        final_pdf.seek(0)
+    summary_pdf.close()
+    return final_pdf.getvalue()
+
+# ✅ Build summary + resume PDF once per version; None if the LaTeX fails to compile
+def build_final_pdf(data, merge=merge_final_pdf):
+    # ✅ Create resume PDF (second page onward)
+    resume_pdf = compile_latex_to_pdf(data.get("latex_code", ""))
+    if not resume_pdf:
+        return None
+
+    resume_pdf_bytes = resume_pdf.getvalue()
+    resume_pdf.close()
+    return merge(
+        data.get("score", 0),
+        data.get("feedback", "No feedback available."),
+        data.get("optimization_message", ""),
+        data.get("company_name", ""),
+        resume_pdf_bytes
+    )
+
+def stream_bytes(data, chunk_size=None):
+    # WSGI servers only accept bytes; slice a memoryview so only one chunk is copied at a time
+    view = memoryview(data)
+    chunk_size = chunk_size or PDF_STREAM_CHUNK
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+# ✅ Serve combined final PDF (auto download)
+@bp.route("/download_pdf/<resume_id>", methods=["GET"])
+@login_required
+def download_pdf(resume_id):
+    try:
+        # ✅ Validate resume existence
+        data = resume_store.get(resume_id)
+        if data is None:
+            return "Invalid resume ID", 404
+
+        version = final_pdf_version(data)
+        headers = {
+            "ETag": f'"{version}"',
+            "Cache-Control": "private, no-cache",
+        }
+
+        # ✅ Browser already has this version
+        if etag_matches(request.headers.get("If-None-Match"), version):
+            return Response(status=304, headers=headers)
+
+        pdf_bytes = final_pdf_cache.get(version)
+        if pdf_bytes is None:
+            pdf_bytes = build_final_pdf(data)
+            if pdf_bytes is None:
+                return "Failed to compile resume LaTeX.", 500
+            final_pdf_cache.set(version, pdf_bytes)
+        else:
+            logging.info("♻️ Final PDF served from cache")
 
         # ✅ Prepare filename
         filename = f"Resume_{resume_id[:8]}.pdf"
+        headers["Content-Disposition"] = f"attachment;filename={filename}"
+        headers["Content-Length"] = str(len(pdf_bytes))
 
-        # ✅ Return downloadable response
-        return Response(final_pdf, mimetype='application/pdf', headers={
-            "Content-Disposition": f"attachment;filename={filename}"
-        })
+        # ✅ Stream the cached bytes in chunks instead of copying them into a response buffer
+        return Response(stream_bytes(pdf_bytes), mimetype='application/pdf', headers=headers)
 
+    except CompileQueueFull as e:
+        return "Too many PDF compiles in progress, please retry shortly.", 429, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         logging.exception("❌ Error generating final PDF")
         return "Error generating final PDF.", 500
 
+# ✅ Bulk export: many resume IDs → one ZIP, streamed as each PDF finishes
+EXPORT_MAX_ITEMS = _env_int("EXPORT_MAX_ITEMS", 50)
+EXPORT_CONCURRENCY = _env_int("EXPORT_CONCURRENCY", LATEX_COMPILE_WORKERS)
+# Leave one core to the web process; 0 (the default on a single CPU) = merge in the export thread
+EXPORT_PROCESSES = _env_int("EXPORT_PROCESSES", min(4, (os.cpu_count() or 1) - 1))
+EXPORT_QUEUE_RETRIES = _env_int("EXPORT_QUEUE_RETRIES", 3)
+
+# 🏭 xelatex already runs as its own process under compile_scheduler; the summary page and
+# merge (reportlab + PyPDF2) are the GIL-bound part of an export, so they get worker processes
+class PdfMergePool:
+    def __init__(self, processes):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+        self.merged = 0
+        self.in_thread = 0
+
+    def _pool(self):
+        with self._lock:
+            if self.processes <= 0:
+                return None
+            if self._executor is None:
+                # 🧵 spawn, not fork: forking a threaded server can copy held locks into the child
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def merge(self, *args):
+        pool = self._pool()
+        if pool is not None:
+            try:
+                pdf_bytes = pool.submit(merge_final_pdf, *args).result()
+                with self._lock:
+                    self.merged += 1
+                return pdf_bytes
+            except BrokenProcessPool:
+                logging.error("❌ PDF merge worker died, recreating the process pool")
+                with self._lock:
+                    if self._executor is pool:
+                        self._executor = None
+        with self._lock:
+            self.in_thread += 1
+        return merge_final_pdf(*args)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "started": self._executor is not None,
+                "merged": self.merged,
+                "in_thread": self.in_thread,
+            }
+
+pdf_merge_pool = PdfMergePool(EXPORT_PROCESSES)
+
+class ExportItemError(Exception):
+    pass
+
+def export_final_pdf(data):
+    version = final_pdf_version(data)
+    pdf_bytes = final_pdf_cache.get(version)
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    for attempt in range(EXPORT_QUEUE_RETRIES + 1):
+        try:
+            pdf_bytes = build_final_pdf(data, merge=pdf_merge_pool.merge)
+            break
+        except CompileQueueFull as e:
+            # 🚦 Someone else filled the compile queue — wait our turn instead of failing the item
+            if attempt == EXPORT_QUEUE_RETRIES:
+                raise ExportItemError("PDF compile queue stayed full")
+            time.sleep(min(e.retry_after, 10))
+
+    if pdf_bytes is None:
+        raise ExportItemError("Failed to compile resume LaTeX.")
+    final_pdf_cache.set(version, pdf_bytes)
+    return pdf_bytes
+
+# ✅ Write-only file for ZipFile: holds written bytes until the response drains them
+class _ZipSink:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+def _export_ids_from_request():
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        ids = payload.get("resume_ids") or []
+    else:
+        ids = request.form.getlist("resume_id")
+        for value in request.form.getlist("resume_ids"):
+            ids += value.replace(",", "\n").split()
+    # Same ID twice is the same file — keep the first
+    return list(OrderedDict.fromkeys(str(i).strip() for i in ids if str(i).strip()))
+
+@bp.route("/export_pdfs", methods=["POST"])
+@login_required
+def export_pdfs():
+    resume_ids = _export_ids_from_request()
+    if not resume_ids:
+        return jsonify({"error": "At least one resume ID is required."}), 400
+    if len(resume_ids) > EXPORT_MAX_ITEMS:
+        return jsonify({"error": f"At most {EXPORT_MAX_ITEMS} resumes per export."}), 400
+
+    entries = {resume_id: resume_store.get(resume_id) for resume_id in resume_ids}
+    manifest = [{"resume_id": resume_id, "status": "not_found", "error": "Invalid resume ID"}
+                for resume_id, data in entries.items() if data is None]
+    found = [resume_id for resume_id, data in entries.items() if data is not None]
+    if not found:
+        return jsonify({"error": "None of the resume IDs exist.", "items": manifest}), 404
+
+    # 🔀 Compiles start now, before the client reads the first byte
+    pool = ThreadPoolExecutor(max_workers=max(1, min(EXPORT_CONCURRENCY, len(found))),
+                              thread_name_prefix="resume-export")
+    futures = {pool.submit(export_final_pdf, entries[resume_id]): resume_id for resume_id in found}
+    started = time.perf_counter()
+
+    def stream():
+        sink = _ZipSink()
+        names = set()
+        exported = 0
+        try:
+            # 📦 PDFs are already compressed — store them, deflate would only burn CPU
+            with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+                for future in as_completed(futures):
+                    resume_id = futures[future]
+                    item = {"resume_id": resume_id}
+                    try:
+                        pdf_bytes = future.result()
+                        name = f"Resume_{resume_id[:8]}.pdf"
+                        if name in names:
+                            name = f"Resume_{resume_id}.pdf"
+                        names.add(name)
+                        archive.writestr(name, pdf_bytes)
+                        item.update({"status": "ok", "file": name, "bytes": len(pdf_bytes)})
+                        exported += 1
+                    except ExportItemError as e:
+                        item.update({"status": "failed", "error": str(e)})
+                    except Exception:
+                        logging.exception(f"❌ Export of {resume_id} failed")
+                        item.update({"status": "failed", "error": "Error generating final PDF."})
+                    metrics.inc("resume_export_items_total", help="Resumes processed by bulk export",
+                                result=item["status"])
+                    manifest.append(item)
+                    yield from sink.drain()
+
+                # 🧾 Per-item results go last: failures are only known once everything has finished
+                manifest.sort(key=lambda entry: resume_ids.index(entry["resume_id"]))
+                archive.writestr("manifest.json", json.dumps({
+                    "requested": len(resume_ids),
+                    "exported": exported,
+                    "failed": len(resume_ids) - exported,
+                    "items": manifest
+                }, indent=2))
+            yield from sink.drain()
+            logging.info(f"📦 Exported {exported}/{len(resume_ids)} resumes in "
+                         f"{time.perf_counter() - started:.2f}s")
+        finally:
+            # Client went away mid-download: don't start compiles nobody will read
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream(), mimetype="application/zip", headers={
+        "Content-Disposition": f"attachment;filename=Resumes_{len(resume_ids)}.zip",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 # ✅ Generate new LaTeX for skills section from analyzed data
+SKILLS_SECTION_HEADER = "%-----------SKILLS and CERTIFICATIONS-----------"
+
 def generate_skills_latex(skills_data):
     try:
         section_lines = []
@@ -638,13 +4270,13 @@ def generate_skills_latex(skills_data):
         certs = skills_data.get("current_certifications", []) + skills_data.get("recommended_certifications", [])
         certs_text = ", ".join(certs) if certs else "No current certifications"
 
-        full_block = f"""%-----------SKILLS and CERTIFICATIONS-----------
+        full_block = f"""{SKILLS_SECTION_HEADER}
 \\section{{Professional Skills \\& Certifications}}
  \\begin{{itemize}}[leftmargin=0.15in, label={{}}]
     \\small{{\\item{{
 {chr(10).join(section_lines)}
      \\textbf{{Certifications}}{{: {certs_text}}}
-    }}
+    }}}}
  \\end{{itemize}}"""
 
         return full_block
@@ -654,15 +4286,15 @@ def generate_skills_latex(skills_data):
         return ""
 
 # ✅ Route to regenerate + update LaTeX resume with new skills section
-@app.route("/regenerate_skills_latex", methods=["POST"])
+@bp.route("/regenerate_skills_latex", methods=["POST"])
 @login_required
 def regenerate_skills_latex():
     try:
         resume_id = request.form.get("resume_id")
-        if not resume_id or resume_id not in resume_store:
+        entry = resume_store.get(resume_id) if resume_id else None
+        if entry is None:
             return jsonify({"error": "Invalid resume ID"}), 400
 
-        entry = resume_store[resume_id]
         skills_data = entry.get("skills_analysis", {})
 
         if not skills_data:
@@ -674,17 +4306,32 @@ def regenerate_skills_latex():
         old_latex = entry["latex_code"]
         old_skills_section = skills_data.get("latex_skills_section", "")
         if old_skills_section and old_skills_section in old_latex:
+            if not old_skills_section.lstrip().startswith(SKILLS_SECTION_HEADER):
+                new_skills_section = new_skills_section.removeprefix(SKILLS_SECTION_HEADER).lstrip("\n")
             updated_latex = old_latex.replace(old_skills_section, new_skills_section)
         else:
-            updated_latex = old_latex + "\n\n" + new_skills_section  # fallback: just append
+            # 🧩 Locate the existing skills section and replace it in place
+            blocks = split_latex_sections(old_latex)
+            index = find_section_index(blocks, "skills")
+            if index is not None:
+                # The existing section keeps its own comment header; only swap the \section block itself
+                new_skills_section = new_skills_section.removeprefix(SKILLS_SECTION_HEADER).lstrip("\n")
+                blocks[index]["text"] = new_skills_section + "\n"
+            elif blocks[-1]["kind"] == "tail":
+                blocks.insert(-1, {"kind": "section", "title": None, "text": new_skills_section + "\n\n"})
+            else:
+                blocks.append({"kind": "section", "title": None, "text": "\n\n" + new_skills_section})
+            updated_latex = join_latex_sections(blocks)
 
         # Update store
-        resume_store[resume_id]["latex_code"] = updated_latex
-        resume_store[resume_id]["skills_analysis"]["latex_skills_section"] = new_skills_section
+        revision = record_revision(entry, updated_latex, "skills")
+        entry["skills_analysis"]["latex_skills_section"] = new_skills_section
+        resume_store[resume_id] = entry
 
         return jsonify({
             "resume_id": resume_id,
             "latex_skills_section": new_skills_section,
+            "revision": revision,
             "message": "Skills section updated successfully"
         }), 200
 
@@ -692,6 +4339,201 @@ def regenerate_skills_latex():
         logging.exception("❌ Error regenerating skills section")
         return jsonify({"error": "Failed to regenerate skills section"}), 500
 
+# ✅ Revision history: list, fetch, diff, roll back
+@bp.route("/revisions/<resume_id>", methods=["GET"])
+@login_required
+def list_revisions(resume_id):
+    entry = resume_store.get(resume_id)
+    if entry is None:
+        return jsonify({"error": "Invalid resume ID"}), 404
+
+    history = revision_history(entry)
+    revisions = []
+    for item in history:
+        head = item is history[-1]
+        revisions.append({
+            "rev": item["rev"],
+            "source": item["source"],
+            "created_at": item["created_at"],
+            "score": entry.get("score") if head else item.get("score"),
+            "head": head,
+            "stored_bytes": len(item.get("delta", "")) + len(item.get("feedback", "")),
+            **({"rolled_back_to": item["rolled_back_to"]} if "rolled_back_to" in item else {}),
+        })
+    return jsonify({"resume_id": resume_id, "revisions": revisions}), 200
+
+@bp.route("/revisions/<resume_id>/<int:rev>", methods=["GET"])
+@login_required
+def get_revision(resume_id, rev):
+    entry = resume_store.get(resume_id)
+    if entry is None:
+        return jsonify({"error": "Invalid resume ID"}), 404
+    snapshot = revision_snapshot(entry, rev)
+    if snapshot is None:
+        return jsonify({"error": f"Unknown revision {rev}"}), 404
+    return jsonify(dict(snapshot, resume_id=resume_id)), 200
+
+@bp.route("/revisions/<resume_id>/diff", methods=["GET"])
+@login_required
+def diff_revisions(resume_id):
+    entry = resume_store.get(resume_id)
+    if entry is None:
+        return jsonify({"error": "Invalid resume ID"}), 404
+
+    history = revision_history(entry)
+    head_rev = history[-1]["rev"]
+    to_rev = request.args.get("to", head_rev, type=int)
+    from_rev = request.args.get("from", to_rev - 1, type=int)
+    old, new = revision_snapshot(entry, from_rev), revision_snapshot(entry, to_rev)
+    if old is None or new is None:
+        return jsonify({"error": "Unknown revision"}), 404
+
+    diff = "".join(difflib.unified_diff(
+        old["latex_code"].splitlines(True), new["latex_code"].splitlines(True),
+        fromfile=f"rev{from_rev}", tofile=f"rev{to_rev}",
+        n=request.args.get("context", 3, type=int)
+    ))
+    return jsonify({
+        "resume_id": resume_id,
+        "from": from_rev,
+        "to": to_rev,
+        "score_from": old["score"],
+        "score_to": new["score"],
+        "diff": diff
+    }), 200
+
+@bp.route("/revisions/<resume_id>/rollback", methods=["POST"])
+@login_required
+def rollback_revision(resume_id):
+    entry = resume_store.get(resume_id)
+    if entry is None:
+        return jsonify({"error": "Invalid resume ID"}), 404
+
+    rev = request.form.get("rev", type=int)
+    snapshot = revision_snapshot(entry, rev) if rev is not None else None
+    if snapshot is None:
+        return jsonify({"error": "Unknown revision"}), 404
+
+    # ⏪ Rolling back is itself a new revision, so nothing after it is lost
+    revision = record_revision(entry, snapshot["latex_code"], "rollback", rolled_back_to=rev)
+    entry["score"] = snapshot["score"]
+    entry["feedback"] = snapshot["feedback"]
+    resume_store[resume_id] = entry
+
+    return jsonify({
+        "message": f"Rolled back to revision {rev}.",
+        "resume_id": resume_id,
+        "revision": revision,
+        "latex_code": snapshot["latex_code"],
+        "score": snapshot["score"],
+        "feedback": snapshot["feedback"]
+    }), 200
+
+# ✅ Runtime stats (cache hit/miss counters etc.)
+@bp.route("/stats", methods=["GET"])
+@login_required
+def stats():
+    return jsonify({
+        "gemini_guard": gemini_guard.stats(),
+        "generation_flights": generation_flights.stats(),
+        "latex_lint": latex_lint_stats.stats(),
+        "templates": templates.stats(),
+        "latex_compiles": compile_scheduler.stats(),
+        "skill_taxonomy": skill_taxonomy.stats(),
+        "job_profiles": job_profiles.stats(),
+        "pdf_merge_pool": pdf_merge_pool.stats(),
+        "llm_cache": llm_cache.stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "final_pdf_cache": final_pdf_cache.stats(),
+        "jobs": job_manager.stats(),
+        "gemini_clients": gemini_pool.stats(),
+        "ats_agreement": ats_agreement.stats(),
+        "prompt_tokens": prompt_size_stats.stats(),
+        "resume_store": resume_store.stats(),
+        "process": {
+            "pid": os.getpid(),
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        }
+    }), 200
+
+# ✅ Subsystem stats exposed as gauges on /metrics
+def _subsystem_gauges():
+    sources = {
+        "gemini_guard": gemini_guard.stats,
+        "generation_flights": generation_flights.stats,
+        "latex_compiles": compile_scheduler.stats,
+        "skill_taxonomy": skill_taxonomy.stats,
+        "job_profiles": job_profiles.stats,
+        "pdf_merge_pool": pdf_merge_pool.stats,
+        "llm_cache": llm_cache.stats,
+        "pdf_cache": pdf_cache.stats,
+        "final_pdf_cache": final_pdf_cache.stats,
+        "jobs": job_manager.stats,
+        "gemini_clients": gemini_pool.stats,
+        "resume_store": resume_store.stats,
+    }
+    for subsystem, stats_fn in sources.items():
+        for key, value in stats_fn().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield (f"resume_{subsystem}_{key}", "gauge", f"{subsystem} {key}", {}, value)
+    for key, state in gemini_guard.breaker_states().items():
+        yield ("resume_llm_breaker_state", "gauge", "Gemini circuit state (0 closed, 1 half-open, 2 open)",
+               {"key": key}, state)
+    yield ("resume_process_max_rss_kb", "gauge", "Peak resident set size",
+           {}, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+metrics.register_collector(_subsystem_gauges)
+
+# ✅ Request timing + optional Server-Timing header
+@bp.before_app_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def _record_request_timing(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = (request.endpoint or "unknown").rsplit(".", 1)[-1]
+    metrics.observe("resume_http_request_seconds", elapsed, help="HTTP request latency",
+                    endpoint=endpoint, method=request.method)
+    metrics.inc("resume_http_requests_total", help="HTTP requests served",
+                endpoint=endpoint, method=request.method, status=response.status_code)
+
+    if TIMING_HEADER or request.headers.get("X-Debug-Timing") == "1":
+        totals = OrderedDict()
+        for stage, seconds in g.get("stage_timings", []):
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+        entries.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+# ✅ Prometheus scrape endpoint (bearer token instead of a session when METRICS_TOKEN is set)
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    token = os.environ.get("METRICS_TOKEN")
+    if token:
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            return "Unauthorized", 401
+    elif not session.get("authenticated"):
+        return redirect(url_for(".login"))
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ✅ App factory (gunicorn "app:create_app()" or the module-level app below)
+def create_app(config=None):
+    app = Flask(__name__)
+    # Needed for session management; set FLASK_SECRET_KEY so every worker process shares it
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
+    if config:
+        app.config.update(config)
+    templates.load_all(strict=TEMPLATE_STRICT)
+    app.register_blueprint(bp)
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     print("🚀 Starting Flask App at http://127.0.0.1:5000")
     app.run(debug=True)
@@ -0,0 +1,84 @@
+"""Local ATS pre-scorer: latency benchmark and agreement report against LLM scores.
+
+Usage:
+    python benchmarks/bench_ats_prescore.py [--jobs 200] [--pairs scores.jsonl]
+
+--pairs takes JSON lines of {"resume": ..., "job_description": ..., "llm_score": N}
+(e.g. exported from resume_store entries) and reports how well the local score
+agrees with the LLM evaluator.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+
+SKILLS = ["python", "java", "sql", "flask", "django", "react", "aws", "docker", "kubernetes",
+          "terraform", "pandas", "spark", "airflow", "graphql", "postgresql", "redis", "kafka",
+          "machine learning", "ci/cd", "typescript", "node.js", "go", "rust", "linux"]
+
+RESUME = r"""
+\section*{Skills}
+\begin{itemize}
+  \item \textbf{Programming:} Python, SQL, JavaScript, TypeScript
+  \item \textbf{Frameworks:} Flask, React, Node.js
+  \item \textbf{Tools/Platforms:} Git, AWS, Docker, Linux
+\end{itemize}
+\section*{Experience}
+\textbf{Backend Engineer} -- built Flask APIs on AWS, tuned PostgreSQL queries, shipped Docker images via CI/CD.
+"""
+
+
+def make_job(rng):
+    wanted = rng.sample(SKILLS, 8)
+    return ("We are hiring a backend engineer. Must have " + ", ".join(wanted[:5]) +
+            ". Nice to have: " + ", ".join(wanted[5:]) + ". You will design scalable services.")
+
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pairs")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    jobs = [make_job(rng) for _ in range(args.jobs)]
+
+    single = timeit(lambda: app.ats_prescore(RESUME, jobs[0]), args.repeat)
+    batch = timeit(lambda: app.ats_prescore_batch(RESUME, jobs), args.repeat)
+    looped = timeit(lambda: [app.ats_prescore(RESUME, jd) for jd in jobs], max(1, args.repeat // 4))
+
+    print(f"single posting          : {single * 1000:8.2f} ms")
+    print(f"batch of {args.jobs:<4} (one pass): {batch * 1000:8.2f} ms  ({batch / args.jobs * 1e6:.0f} us/posting)")
+    print(f"batch of {args.jobs:<4} (looped)  : {looped * 1000:8.2f} ms")
+
+    if args.pairs:
+        pairs = []
+        with open(args.pairs, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    local = app.ats_prescore(row["resume"], row["job_description"])["score"]
+                    pairs.append((local, row["llm_score"]))
+        print("agreement vs LLM scores :", json.dumps(app.ats_agreement.stats(pairs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
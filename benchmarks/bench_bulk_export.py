@@ -0,0 +1,108 @@
+"""Bulk PDF export: N x /download_pdf one after another vs. one /export_pdfs ZIP.
+
+Usage:
+    python benchmarks/bench_bulk_export.py [--resumes 12] [--latency 1.0] [--pages 2] [--processes 4]
+
+"sequential" downloads every resume through /download_pdf in turn, which is what
+recruiters do today. "export" posts all IDs to /export_pdfs once with the summary
+page + merge done in the export threads; "export+procs" does the same with the
+merge in a --processes worker pool. Compiles run LATEX_COMPILE_WORKERS wide in
+every case. xelatex is faked with a sleep (see fake_gemini.install_fake_xelatex).
+Final/compiled PDF caches are cleared between runs so every PDF is rebuilt.
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+
+
+def make_sessions(count):
+    feedback = "\n".join(f"- **Point {i}:** " + "concrete feedback for this section " * 6 for i in range(10))
+    return [
+        app.save_resume_session({
+            "latex_code": fake_gemini.sample_latex(f"export-{i}"),
+            "score": 7,
+            "feedback": feedback,
+            "optimization_message": "Optimized for the posting."
+        }, "resume text", "job description", f"Company {i}", "")
+        for i in range(count)
+    ]
+
+
+def sequential(client, resume_ids):
+    started = time.perf_counter()
+    first = None
+    for resume_id in resume_ids:
+        response = client.get(f"/download_pdf/{resume_id}")
+        assert response.status_code == 200, response.status_code
+        if first is None:
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started, len(resume_ids)
+
+
+def export(client, resume_ids):
+    started = time.perf_counter()
+    first = None
+    response = client.post("/export_pdfs", json={"resume_ids": resume_ids}, buffered=False)
+    body = io.BytesIO()
+    for chunk in response.response:
+        if first is None and chunk:
+            first = time.perf_counter() - started
+        body.write(chunk)
+    response.close()
+    total = time.perf_counter() - started
+    names = zipfile.ZipFile(body).namelist()
+    return first, total, sum(name.endswith(".pdf") for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resumes", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per fake xelatex run")
+    parser.add_argument("--pages", type=int, default=2, help="pages in the fake compiled resume")
+    parser.add_argument("--processes", type=int, default=4, help="merge worker processes for export+procs")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    fake_gemini.install(app, fake_gemini.FakeGenerativeModel(latency=0, jitter=0))
+    fake_gemini.install_fake_xelatex(app, latency=args.latency, pages=args.pages)
+    app.pdf_cache.max_entries = 0
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["authenticated"] = True
+    resume_ids = make_sessions(args.resumes)
+
+    def run_export(processes):
+        def run():
+            app.pdf_merge_pool.processes = processes
+            return export(client, resume_ids)
+        return run
+
+    # Start the worker processes outside the measurement
+    app.pdf_merge_pool.processes = args.processes
+    app.pdf_merge_pool.merge(7, "warm up", "", "", app.compile_latex_to_pdf(fake_gemini.sample_latex()).getvalue())
+
+    print(f"{args.resumes} resumes, {args.latency:g}s per compile, "
+          f"{app.compile_scheduler.workers} compile workers, {os.cpu_count()} CPUs")
+    print(f"{'mode':<14}{'first byte s':>14}{'total s':>10}{'pdfs':>6}")
+    for name, fn in (("sequential", lambda: sequential(client, resume_ids)),
+                     ("export", run_export(0)),
+                     ("export+procs", run_export(args.processes))):
+        app.final_pdf_cache.clear()
+        first, total, pdfs = fn()
+        print(f"{name:<14}{first:>14.2f}{total:>10.2f}{pdfs:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Peak memory per /download_pdf request, before vs. after the cached, streamed path.
+
+Usage:
+    python benchmarks/bench_download_memory.py [--pages 3] [--runs 5]
+
+"legacy" rebuilds the summary page, compiles, merges into a BytesIO and returns
+the whole buffer on every request (the old download_pdf). "cold" is the new
+route on a cache miss, "warm" a cache hit and "304" a conditional GET with the
+current ETag. xelatex is faked (see fake_gemini.install_fake_xelatex); peaks are
+measured with tracemalloc while the streamed body is consumed chunk by chunk.
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+from flask import Response  # noqa: E402
+from PyPDF2 import PdfMerger  # noqa: E402
+
+
+def legacy_download_pdf(resume_id):
+    data = app.resume_store.get(resume_id)
+    summary_pdf = app.create_summary_pdf(
+        score=data.get("score", 0),
+        feedback=data.get("feedback", "No feedback available."),
+        optimization_note=data.get("optimization_message", ""),
+        company_name=data.get("company_name", "")
+    )
+    resume_pdf = app.compile_latex_to_pdf(data.get("latex_code", ""))
+    merger = PdfMerger()
+    merger.append(summary_pdf)
+    merger.append(resume_pdf)
+    final_pdf = io.BytesIO()
+    merger.write(final_pdf)
+    merger.close()
+    final_pdf.seek(0)
+    return Response(final_pdf, mimetype="application/pdf", headers={
+        "Content-Disposition": f"attachment;filename=Resume_{resume_id[:8]}.pdf"
+    })
+
+
+def measure(client, path, headers=None):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    response = client.get(path, headers=headers or {}, buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return response.status_code, size, peak, response.headers.get("ETag")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=3, help="pages in the fake compiled resume")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    fake_gemini.install(app, fake_gemini.FakeGenerativeModel(latency=0, jitter=0))
+    fake_gemini.install_fake_xelatex(app, latency=0, pages=args.pages)
+    app.app.add_url_rule("/legacy_download_pdf/<resume_id>", "legacy_download_pdf", legacy_download_pdf)
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["authenticated"] = True
+    resume_id = client.post("/generate_resume", data={
+        "resume_content": "Jane Doe, backend engineer", "job_description": "Python, Flask, AWS",
+        "company_name": "Acme"}).get_json()["resume_id"]
+
+    def legacy():
+        return measure(client, f"/legacy_download_pdf/{resume_id}")
+
+    def cold():
+        app.final_pdf_cache.clear()
+        return measure(client, f"/download_pdf/{resume_id}")
+
+    def warm():
+        return measure(client, f"/download_pdf/{resume_id}")
+
+    def not_modified():
+        etag = client.get(f"/download_pdf/{resume_id}").headers["ETag"]
+        return measure(client, f"/download_pdf/{resume_id}", {"If-None-Match": etag})
+
+    app.final_pdf_cache.max_entries = 16
+    print(f"{'path':<10}{'status':>8}{'bytes':>10}{'peak KiB':>12}")
+    for name, fn in (("legacy", legacy), ("cold", cold), ("warm", warm), ("304", not_modified)):
+        fn()  # warm up imports / fonts outside the measurement
+        results = [fn() for _ in range(args.runs)]
+        status, size = results[-1][0], results[-1][1]
+        peak = sorted(r[2] for r in results)[len(results) // 2]
+        print(f"{name:<10}{status:>8}{size:>10}{peak / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
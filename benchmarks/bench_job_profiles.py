@@ -0,0 +1,83 @@
+"""Job-description work per submission, with vs. without the shared profile store.
+
+Usage:
+    python benchmarks/bench_job_profiles.py [--submissions 500] [--postings 40] [--words 500]
+
+Simulates resumes submitted against a pool of postings whose popularity follows a
+Zipf-like curve (a few postings get most submissions). Each submission runs what
+generate / evaluate / analyze_skills do locally with the posting: the ATS
+pre-score and the taxonomy skills analysis. "no store" extracts the posting every
+time; "store" extracts each posting once and reuses the profile.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+
+
+def make_postings(count, words, rng):
+    with open(os.path.join(ROOT, "skills_taxonomy.json"), encoding="utf-8") as f:
+        taxonomy = json.load(f)
+    skills = [name for group in taxonomy["skills"].values() for name in group]
+    filler = ("build maintain scalable services with the team across product design review ship reliable "
+              "systems customers data platform ownership quality performance on-call mentor").split()
+    titles = ["Senior Backend Engineer", "Data Engineer", "Frontend Developer", "Staff Platform Engineer",
+              "Junior Software Engineer", "Engineering Manager", "ML Engineer", "DevOps Engineer"]
+    postings = []
+    for i in range(count):
+        body = [rng.choice(skills) if rng.random() < 0.15 else rng.choice(filler) for _ in range(words)]
+        postings.append(f"{rng.choice(titles)} #{i}\n{rng.randint(1, 9)}+ years of experience.\n" + " ".join(body))
+    return postings
+
+
+def run(postings, order, latex):
+    samples = []
+    for index in order:
+        started = time.perf_counter()
+        app.ats_prescore(latex, postings[index])
+        app.local_skills_analysis(latex, postings[index])
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--submissions", type=int, default=500)
+    parser.add_argument("--postings", type=int, default=40)
+    parser.add_argument("--words", type=int, default=500, help="words per posting")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    postings = make_postings(args.postings, args.words, rng)
+    weights = [1.0 / (rank + 1) for rank in range(args.postings)]
+    order = rng.choices(range(args.postings), weights=weights, k=args.submissions)
+    latex = fake_gemini.sample_latex("profiles")
+    app.skill_taxonomy.available()
+    app.ats_prescore(latex, "warm up numpy")
+
+    print(f"{args.submissions} submissions over {args.postings} postings of ~{args.words} words")
+    print(f"{'mode':<10}{'mean ms':>10}{'p95 ms':>10}{'hit rate':>10}")
+    for name, local_entries, store_entries in (("no store", 0, 0), ("store", 256, 1000)):
+        app.job_profiles = app.JobProfileStore(
+            app.MemoryResumeStore(f"bench_{local_entries}", max_entries=store_entries), local_entries)
+        samples = run(postings, order, latex)
+        p95 = sorted(samples)[int(len(samples) * 0.95)]
+        stats = app.job_profiles.stats()
+        print(f"{name:<10}{statistics.mean(samples):>10.2f}{p95:>10.2f}{stats['hit_rate']:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
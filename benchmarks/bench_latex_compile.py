@@ -0,0 +1,82 @@
+"""Cold vs warm xelatex compile times (full compile vs precompiled preamble format).
+
+Usage:
+    python benchmarks/bench_latex_compile.py [--runs 5]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+
+
+def load_template():
+    for path in ("templates/latex_template.tex", "latex_template.tex"):
+        full = os.path.join(ROOT, path)
+        if os.path.exists(full):
+            with open(full, "r", encoding="utf-8") as f:
+                return f.read()
+    sys.exit("latex_template.tex not found")
+
+
+def sample_resume(template, i):
+    # Vary the body on every run so nothing is served from the PDF cache
+    return (template
+            .replace("<FULL_NAME>", f"Jane Doe {i}")
+            .replace("<EMAIL>", "jane@example.com")
+            .replace("<PHONE>", "+1 555 0100")
+            .replace("<LINK>", "https://example.com")
+            .replace("<BRIEF_SUMMARY>", f"Backend engineer, run {i}."))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    ok = fn() is not None
+    return time.perf_counter() - start, ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    if not shutil.which("xelatex"):
+        sys.exit("xelatex not found on PATH")
+
+    template = load_template()
+    app.templates.override("latex_template", template)
+
+    cold = []
+    for i in range(args.runs):
+        elapsed, ok = timed(lambda: app._compile_latex_full(sample_resume(template, i)))
+        if not ok:
+            sys.exit("full compile failed")
+        cold.append(elapsed)
+
+    name = app.template_format_name()
+    preamble, _ = app.split_latex_preamble(template)
+    start = time.perf_counter()
+    if not app.ensure_preamble_format(name, preamble):
+        sys.exit("format dump failed — is mylatexformat installed?")
+    dump_time = time.perf_counter() - start
+
+    warm = []
+    for i in range(args.runs):
+        elapsed, ok = timed(lambda: app._compile_with_preamble_format(sample_resume(template, 1000 + i)))
+        if not ok:
+            sys.exit("fast compile failed")
+        warm.append(elapsed)
+
+    print(f"format dump (one-off): {dump_time * 1000:8.1f} ms")
+    print(f"cold  full compile   : median {statistics.median(cold) * 1000:8.1f} ms  (n={len(cold)})")
+    print(f"warm  format compile : median {statistics.median(warm) * 1000:8.1f} ms  (n={len(warm)})")
+    print(f"speedup              : {statistics.median(cold) / statistics.median(warm):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Stored size of a resume session as revisions accumulate: delta history vs. full copies.
+
+Usage:
+    python benchmarks/bench_revision_memory.py [--revisions 50] [--bullets 40] [--edits 2]
+
+A session starts from a resume with --bullets experience bullets; every revision
+rewrites --edits bullets (what an optimize pass or skills regeneration does).
+"delta" is the resume_store entry as app.py keeps it (head + compressed reverse
+deltas); "full copies" keeps every revision's LaTeX verbatim in the entry.
+Sizes are the JSON bytes the store holds for that one session.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+
+FEEDBACK = fake_gemini.EVALUATOR_REPLY
+
+
+def bullet(i, version):
+    return f"    \\item Built service {i} (v{version}): cut p95 latency 30\\% and shipped features for team {i % 7}\n"
+
+
+def build_latex(bullets):
+    base = fake_gemini.sample_latex()
+    body = "".join(bullets)
+    return base.replace("    \\item Developed ...\n    \\item Achieved ...\n", body, 1)
+
+
+def entry_bytes(entry):
+    return len(json.dumps(entry).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--revisions", type=int, default=50)
+    parser.add_argument("--bullets", type=int, default=40)
+    parser.add_argument("--edits", type=int, default=2)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(7)
+
+    bullets = [bullet(i, 0) for i in range(args.bullets)]
+    latex = build_latex(bullets)
+    entry = {"latex_code": latex, "score": 6, "feedback": FEEDBACK, "history": [app.new_revision(1, "generated")]}
+    naive = {"latex_code": latex, "score": 6, "feedback": FEEDBACK, "history": []}
+
+    app.REVISION_MAX = max(app.REVISION_MAX, args.revisions + 1)
+    write_time = 0.0
+    print(f"document: {len(latex)} bytes, {args.edits} bullet edits per revision")
+    print(f"{'revisions':>10}{'delta KiB':>12}{'full copies KiB':>17}{'ratio':>8}")
+    for rev in range(2, args.revisions + 2):
+        for i in rng.sample(range(args.bullets), args.edits):
+            bullets[i] = bullet(i, rev)
+        new_latex = build_latex(bullets)
+
+        naive["history"].append({"latex_code": naive["latex_code"], "score": naive["score"], "feedback": naive["feedback"]})
+        naive["latex_code"] = new_latex
+
+        started = time.perf_counter()
+        app.record_revision(entry, new_latex, "optimized")
+        write_time += time.perf_counter() - started
+
+        if rev in (2, 5, 10, 25, 50, 100, 200) or rev == args.revisions + 1:
+            delta_size, naive_size = entry_bytes(entry), entry_bytes(naive)
+            print(f"{rev:>10}{delta_size / 1024:>12.1f}{naive_size / 1024:>17.1f}{naive_size / delta_size:>8.1f}x")
+
+    started = time.perf_counter()
+    oldest = app.revision_snapshot(entry, entry["history"][0]["rev"])
+    rebuild = time.perf_counter() - started
+    assert oldest["latex_code"] == latex, "oldest revision did not round-trip"
+    print(f"record_revision: {write_time / args.revisions * 1e3:.2f} ms avg; "
+          f"rebuilding the oldest of {len(entry['history'])} revisions: {rebuild * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""analyze_skills: whole analysis by Gemini vs. the local taxonomy fast path.
+
+Usage:
+    python benchmarks/bench_skills_taxonomy.py [--runs 50] [--latency 2.0]
+
+"llm" is the legacy path (SKILLS_ANALYSIS=llm): the full resume + job description
+go to Gemini and the reply is parsed. "taxonomy" matches skills and
+certifications locally only (/analyze_skills with local=1). "taxonomy+llm" adds
+the short recommendations-only call. Gemini is faked with --latency seconds per
+call (see fake_gemini.py); prompt sizes are estimated the same way app.py does.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+
+JOB_DESCRIPTION = """Senior Backend Engineer
+We are looking for an engineer with 5+ years of Python or Go, building REST APIs and gRPC services
+on Kubernetes (EKS) with Terraform-managed AWS infrastructure. You will own CI/CD pipelines in
+GitHub Actions, tune PostgreSQL and Redis, and stream events through Kafka. Experience with
+Prometheus/Grafana monitoring, OAuth, and SOC 2 controls is a plus. CKA or AWS Certified Solutions
+Architect preferred. Strong communication and mentoring skills; Agile/Scrum team."""
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50, help="runs for the local-only path")
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per fake Gemini call")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    model = fake_gemini.install(app, fake_gemini.FakeGenerativeModel(latency=args.latency, jitter=0))
+    latex = fake_gemini.sample_latex("taxonomy")
+    app.skill_taxonomy.available()  # load + compile outside the measurement
+
+    def legacy():
+        app.SKILLS_ANALYSIS = "llm"
+        try:
+            return app.analyze_skills(model, latex, JOB_DESCRIPTION)
+        finally:
+            app.SKILLS_ANALYSIS = "taxonomy"
+
+    modes = (
+        ("llm", legacy, 3),
+        ("taxonomy", lambda: app.analyze_skills(model, latex, JOB_DESCRIPTION, recommend=False), args.runs),
+        ("taxonomy+llm", lambda: app.analyze_skills(model, latex, JOB_DESCRIPTION), 3),
+    )
+    print(f"taxonomy: {app.skill_taxonomy.terms} terms, {app.skill_taxonomy.stats()['states']} automaton states, "
+          f"compiled in {app.skill_taxonomy.load_ms:.1f} ms; fake Gemini latency {args.latency:g}s")
+    print(f"{'mode':<14}{'median ms':>12}{'gemini calls':>14}{'current':>9}{'missing':>9}")
+    for name, fn, runs in modes:
+        calls = model.calls
+        median, result = timed(fn, runs)
+        print(f"{name:<14}{median:>12.2f}{(model.calls - calls) / runs:>14.1f}"
+              f"{len(result['current_skills']):>9}{len(result['missing_skills']):>9}")
+
+    print("\nprompt tokens (sent / what the full-resume prompt would be):")
+    for call, item in app.prompt_size_stats.stats().items():
+        if call.startswith("skills_"):
+            print(f"  {call:<24}{item['sent_tokens'] // item['calls']:>6} / {item['full_tokens'] // item['calls']}")
+
+
+if __name__ == "__main__":
+    main()
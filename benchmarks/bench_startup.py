@@ -0,0 +1,71 @@
+"""Cold-start time of app.py: module import + create_app, and the deferred heavy imports.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 7]
+
+Each sample is a fresh interpreter. "import app" covers the module body and the
+module-level create_app() (template registry preload included); "first PDF" and
+"first ATS score" are the first calls that pull in reportlab/PyPDF2 and numpy.
+"eager imports" is what importing those libraries (plus google.generativeai when
+installed) up front used to add to every cold start.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, logging, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+logging.disable(logging.CRITICAL)
+app.create_app()
+t2 = time.perf_counter()
+app.create_summary_pdf(7, "Score: 7/10", "", "Acme")
+t3 = time.perf_counter()
+app.ats_prescore("Python Flask AWS", "Python, Kubernetes, AWS")
+t4 = time.perf_counter()
+print(json.dumps({{"import app": t1 - t0, "create_app": t2 - t1, "first PDF": t3 - t2, "first ATS score": t4 - t3}}))
+"""
+
+EAGER = r"""
+import importlib, json, time
+t0 = time.perf_counter()
+for name in ("numpy", "reportlab.pdfgen.canvas", "reportlab.lib.utils", "PyPDF2", "google.generativeai"):
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+print(json.dumps({"eager imports": time.perf_counter() - t0}))
+"""
+
+
+def sample(code):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    samples = {}
+    for _ in range(args.runs):
+        for code in (CHILD.format(root=ROOT), EAGER):
+            for name, seconds in sample(code).items():
+                samples.setdefault(name, []).append(seconds)
+
+    print(f"{'phase':<18}{'median ms':>12}{'min ms':>10}")
+    for name, values in samples.items():
+        print(f"{name:<18}{statistics.median(values) * 1000:>12.1f}{min(values) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
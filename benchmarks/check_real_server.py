@@ -0,0 +1,132 @@
+"""End-to-end check of the streaming routes through a real WSGI server.
+
+Usage:
+    python benchmarks/check_real_server.py [--real-xelatex]
+
+Flask's test client accepts response bodies a real server would reject (for
+example memoryview chunks), so the other benchmarks can't catch those bugs.
+This starts the app under werkzeug's threaded server on a free local port,
+logs in over HTTP and exercises /generate_resume, /download_pdf (full body,
+Content-Length and 304), /export_pdfs, /generate_resume_stream and the skills
+flow (/analyze_skills -> /regenerate_skills_latex -> /download_pdf, after
+checking that generate_skills_latex output passes lint_latex). Gemini is
+faked; xelatex too unless --real-xelatex is passed. Exits non-zero on failure.
+"""
+import argparse
+import http.client
+import http.cookiejar
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+
+class Client:
+    def __init__(self, base):
+        self.base = base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, path, data=None, json_body=None, headers=None):
+        body, headers = None, dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode("utf-8")
+        req = urllib.request.Request(self.base + path, data=body, headers=headers)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+        except http.client.HTTPException as e:
+            # e.g. IncompleteRead when the server aborts a streamed body
+            return 0, {}, repr(e).encode("utf-8")
+
+
+def check(name, ok, detail=""):
+    print(f"{'✅' if ok else '❌'} {name}{': ' + detail if detail else ''}")
+    return ok
+
+
+def check_skills_lint():
+    skills = {"current_skills_by_category": {"Languages": ["Python", "Go"]},
+              "recommended_skills_by_category": {"Cloud": ["Kubernetes"]},
+              "current_certifications": ["CKA"], "recommended_certifications": []}
+    latex = fake_gemini.sample_latex("skills")
+    preamble, body = app.split_latex_preamble(latex)
+    document = preamble + body.replace("\\end{document}", app.generate_skills_latex(skills) + "\n\\end{document}")
+    lint = app.lint_latex(document)
+    return check("skills section lint", not lint["errors"] and "brace" not in lint["fixes"],
+                 f"errors={lint['errors']}, fixes={lint['fixes']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--real-xelatex", action="store_true", help="run the real xelatex binary")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    fake_gemini.install(app, fake_gemini.FakeGenerativeModel(latency=0, jitter=0))
+    if not args.real_xelatex:
+        fake_gemini.install_fake_xelatex(app, latency=0, pages=3)
+    app.final_pdf_cache.max_entries = 16
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Client(f"http://127.0.0.1:{server.server_port}")
+    results = []
+    try:
+        client.request("/login", data={"passcode": app.PASSCODE})
+        status, _, body = client.request("/generate_resume", data={
+            "resume_content": "Jane Doe, backend engineer. Python, Flask, SQL.",
+            "job_description": "Python, Flask, Kubernetes", "company_name": "Acme"})
+        results.append(check("generate_resume", status == 200, str(status)))
+        resume_id = json.loads(body)["resume_id"]
+
+        status, headers, body = client.request(f"/download_pdf/{resume_id}")
+        results.append(check("download_pdf body", status == 200 and body.startswith(b"%PDF")
+                             and len(body) == int(headers.get("Content-Length", -1)),
+                             f"{status}, {len(body)} of {headers.get('Content-Length')} bytes"))
+        status, _, _ = client.request(f"/download_pdf/{resume_id}", headers={"If-None-Match": headers.get("ETag", "")})
+        results.append(check("download_pdf 304", status == 304, str(status)))
+
+        status, _, body = client.request("/export_pdfs", json_body={"resume_ids": [resume_id, "missing"]})
+        names = zipfile.ZipFile(io.BytesIO(body)).namelist() if status == 200 else []
+        results.append(check("export_pdfs zip", status == 200 and "manifest.json" in names and len(names) == 2,
+                             f"{status}, {names}"))
+
+        status, _, body = client.request("/generate_resume_stream", data={
+            "resume_content": "Jane Doe, backend engineer.", "job_description": "Python, Flask"})
+        results.append(check("generate_resume_stream", status == 200 and b"event: done" in body,
+                             f"{status}, {len(body)} bytes"))
+
+        results.append(check_skills_lint())
+        status, _, _ = client.request("/analyze_skills", data={"resume_id": resume_id, "job_description": "Python, Go"})
+        results.append(check("analyze_skills", status == 200, str(status)))
+        status, _, _ = client.request("/regenerate_skills_latex", data={"resume_id": resume_id})
+        results.append(check("regenerate_skills_latex", status == 200, str(status)))
+        status, _, body = client.request(f"/download_pdf/{resume_id}")
+        results.append(check("download_pdf after skills", status == 200 and body.startswith(b"%PDF"), str(status)))
+    finally:
+        server.shutdown()
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""In-process stand-in for a Gemini GenerativeModel, for offline benchmarks.
+
+FakeGenerativeModel answers generate_content() with canned LaTeX, evaluator,
+skills-analysis and fused-JSON replies after a configurable latency, and fails
+a configurable fraction of calls. install() wires it into app.py in place of the
+real client pool.
+"""
+import os
+import random
+import subprocess
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EVALUATOR_REPLY = """Score: 6/10
+
+Feedback:
+- **Job Match:** The resume covers the core backend stack but not the cloud tooling.
+
+- **Skills Relevance:** Missing Kubernetes and Terraform, add them if accurate.
+
+- **Project Alignment:**
+  - *Original:* Built a Flask API.
+  - *Edited:* Built a Flask API on AWS serving 10k requests/day.
+
+- **Experience & Achievements:** Quantify impact in the experience bullets.
+
+- **Formatting:** Clean.
+
+- **Missing Elements:** Certifications.
+
+- **Suggestions for Improvement:**
+  - Add Kubernetes
+  - Quantify results
+  - Mention CI/CD"""
+
+SKILLS_REPLY = """PROFESSION_TYPE: Software Engineer
+SKILL_CATEGORIES: Technical Skills, Other Skills
+CURRENT_SKILLS:
+  Technical Skills: Python, SQL, Flask, Docker
+  Security Skills: OWASP
+  Other Skills: Communication
+CURRENT_CERTIFICATIONS: AWS Certified Cloud Practitioner
+MISSING_SKILLS: Kubernetes, Terraform
+RECOMMENDED_SKILLS: Kubernetes, Terraform, Go
+RECOMMENDED_CERTIFICATIONS: CKA"""
+
+FUSED_REPLY = """{"score": 6, "feedback": {"job_match": "Good backend match.", "skills_relevance": "Missing Kubernetes.",
+"suggestions": ["Add Kubernetes", "Quantify results"]}, "skills": {"profession_type": "Software Engineer",
+"current_skills_by_category": {"Technical Skills": ["Python", "SQL", "Flask"]}, "current_certifications": [],
+"missing_skills": ["Kubernetes"], "recommended_skills": ["Kubernetes", "Go"], "recommended_certifications": ["CKA"]}}"""
+
+
+def load_text(name):
+    for path in (os.path.join(ROOT, "templates", name), os.path.join(ROOT, "prompts", name), os.path.join(ROOT, name)):
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+    return ""
+
+
+def sample_latex(tag=""):
+    return (load_text("latex_template.tex")
+            .replace("<FULL_NAME>", "Jane Doe")
+            .replace("<EMAIL>", "jane@example.com")
+            .replace("<PHONE>", "+1 555 0100")
+            .replace("<LINK>", "https://example.com")
+            .replace("<BRIEF_SUMMARY>", f"Backend engineer with Python, Flask and AWS. {tag}".strip()))
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiError(RuntimeError):
+    pass
+
+
+class FakeGenerativeModel:
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, seed=None, model_name="models/fake-gemini"):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.model_name = model_name
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _reply_for(self, prompt):
+        if '"score"' in prompt and "JSON" in prompt:
+            return FUSED_REPLY
+        if "PROFESSION_TYPE" in prompt:
+            return SKILLS_REPLY
+        if "Score the resume" in prompt:
+            return EVALUATOR_REPLY
+        # Formatter and optimizer both return LaTeX; vary it so optimizations register as changes
+        return sample_latex(f"Revision {self.calls}.")
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._rng.gauss(self.latency, self.jitter)) if self.latency else 0.0
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        # Like the SDK, give up at request_options["timeout"] instead of hanging on
+        timeout = (kwargs.get("request_options") or {}).get("timeout")
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise FakeGeminiError("504 Deadline Exceeded (fake)")
+        time.sleep(delay)
+        if fail:
+            raise FakeGeminiError("429 Resource has been exhausted (fake)")
+
+        text = self._reply_for(prompt)
+        if stream:
+            return [FakeResponse(text[i:i + 64]) for i in range(0, len(text), 64)]
+        return FakeResponse(text)
+
+
+def install(app_module, model, disable_caches=True):
+    """Route every Gemini call in app.py to `model` (prompts come from app.templates)."""
+    app_module.HAS_GENAI = True
+    app_module.default_model = model
+    app_module.model_for_key = lambda api_key: model
+    # The fake has no quota; keep the per-key rate limiter from throttling the benchmark itself
+    app_module.gemini_guard.rate_per_minute = 0
+    if disable_caches:
+        app_module.llm_cache.max_entries = 0
+        app_module.pdf_cache.max_entries = 0
+        app_module.final_pdf_cache.max_entries = 0
+    return model
+
+
+def install_fake_xelatex(app_module, latency=1.5, pages=1):
+    """Replace the xelatex subprocess with a sleep + a reportlab PDF of `pages` pages."""
+    from reportlab.pdfgen import canvas
+
+    def fake_run(args, cwd, env=None, deadline=None):
+        if deadline is not None and time.monotonic() + latency > deadline:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            raise subprocess.TimeoutExpired(args, latency)
+        time.sleep(latency)
+        tex_path = next((a for a in args if a.endswith(".tex")), "resume.tex")
+        pdf_path = os.path.join(cwd, os.path.splitext(os.path.basename(tex_path))[0] + ".pdf")
+        c = canvas.Canvas(pdf_path)
+        for page in range(pages):
+            c.drawString(100, 750, f"Fake compiled resume, page {page + 1}")
+            for line in range(60):
+                c.drawString(60, 720 - line * 11, f"Line {line}: " + "lorem ipsum dolor sit amet " * 3)
+            c.showPage()
+        c.save()
+
+        class Result:
+            stdout = ""
+            stderr = ""
+        return Result()
+
+    app_module._run_xelatex = fake_run
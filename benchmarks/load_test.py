@@ -0,0 +1,140 @@
+"""Concurrent load test of the Flask routes against the fake Gemini model.
+
+Usage:
+    python benchmarks/load_test.py [--requests 40] [--concurrency 8] [--latency 0.5]
+                                   [--error-rate 0.0] [--routes generate_resume,download_pdf]
+                                   [--real-xelatex] [--cache]
+
+Each route is driven with --requests calls from --concurrency threads through
+Flask's test client; p50/p95/p99 latency and requests/sec are printed per route.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+
+RESUME_TEXT = """Jane Doe - jane@example.com - +1 555 0100
+Backend engineer, 5 years. Python, Flask, SQL, Docker, AWS.
+Experience: Acme Corp (2020-2024) built Flask APIs, reduced latency 30%.
+Projects: Resume optimizer (Flask, Gemini). Education: BSc Computer Science."""
+
+JOB_DESCRIPTION = """Senior Backend Engineer. Must have Python, Flask, PostgreSQL, Kubernetes, Terraform,
+AWS and CI/CD experience. Nice to have: Go, Kafka."""
+
+ROUTES = ["generate_resume", "evaluate_resume", "optimize_resume", "analyze_skills", "download_pdf"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_client():
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["authenticated"] = True
+    return client
+
+
+def seed_resume(client):
+    response = client.post("/generate_resume", data={
+        "resume_content": RESUME_TEXT, "job_description": JOB_DESCRIPTION, "company_name": "Acme"})
+    if response.status_code != 200:
+        sys.exit(f"could not seed a resume: {response.status_code} {response.get_data(as_text=True)[:200]}")
+    return response.get_json()["resume_id"]
+
+
+def request_for(route, client, resume_id, i):
+    if route == "generate_resume":
+        return client.post("/generate_resume", data={
+            "resume_content": f"{RESUME_TEXT}\nRun {i}", "job_description": JOB_DESCRIPTION})
+    if route == "download_pdf":
+        return client.get(f"/download_pdf/{resume_id}")
+    return client.post(f"/{route}", data={"resume_id": resume_id})
+
+
+def run_route(route, requests, concurrency, resume_id):
+    local = threading.local()
+    latencies, statuses = [], []
+    lock = threading.Lock()
+
+    def one(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = make_client()
+        start = time.perf_counter()
+        response = request_for(route, client, resume_id, i)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses.append(response.status_code)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    errors = sum(1 for s in statuses if s >= 400)
+    return {
+        "route": route,
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / wall if wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean fake Gemini latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.15)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--xelatex-latency", type=float, default=1.5, help="fake xelatex time (s)")
+    parser.add_argument("--real-xelatex", action="store_true", help="run the real xelatex binary")
+    parser.add_argument("--cache", action="store_true", help="keep the LLM/PDF caches enabled")
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    model = fake_gemini.FakeGenerativeModel(latency=args.latency, jitter=args.jitter,
+                                            error_rate=args.error_rate, seed=42)
+    fake_gemini.install(app, model, disable_caches=not args.cache)
+    if not args.real_xelatex:
+        fake_gemini.install_fake_xelatex(app, latency=args.xelatex_latency)
+
+    saved_error_rate, model.error_rate = model.error_rate, 0.0
+    resume_id = seed_resume(make_client())
+    model.error_rate = saved_error_rate
+
+    print(f"{'route':<18}{'reqs':>6}{'errs':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route in [r.strip() for r in args.routes.split(",") if r.strip()]:
+        if route not in ROUTES:
+            sys.exit(f"unknown route {route!r}; choose from {', '.join(ROUTES)}")
+        result = run_route(route, args.requests, args.concurrency, resume_id)
+        print(f"{route:<18}{result['requests']:>6}{result['errors']:>6}{result['rps']:>9.2f}"
+              f"{result['p50'] * 1000:>10.1f}{result['p95'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}")
+    print(f"fake Gemini calls: {model.calls} ({model.errors} injected errors)")
+
+
+if __name__ == "__main__":
+    main()
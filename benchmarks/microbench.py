@@ -0,0 +1,65 @@
+"""Microbenchmarks for the CPU-bound helpers in app.py.
+
+Usage:
+    python benchmarks/microbench.py [--number 200]
+
+compile_latex_to_pdf is only timed when xelatex is on PATH (and bypasses the
+compiled-PDF cache so every run really compiles).
+"""
+import argparse
+import io
+import logging
+import os
+import shutil
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fake_gemini  # noqa: E402
+from PyPDF2 import PdfMerger  # noqa: E402
+
+
+def report(name, number, fn):
+    best = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    unit, scale = ("ms", 1e3) if best >= 1e-3 else ("us", 1e6)
+    print(f"{name:<28}{best * scale:>10.2f} {unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    feedback = fake_gemini.EVALUATOR_REPLY.replace("\n\n", " ") * 3
+    skills = fake_gemini.SKILLS_REPLY
+    summary_bytes = app.create_summary_pdf(6, fake_gemini.EVALUATOR_REPLY, "Improved.", "Acme").getvalue()
+
+    report("enforce_line_breaks", args.number * 10, lambda: app.enforce_line_breaks(feedback))
+    report("parse_skills_response", args.number * 10, lambda: app.parse_skills_response(skills))
+    report("create_summary_pdf", args.number,
+           lambda: app.create_summary_pdf(6, fake_gemini.EVALUATOR_REPLY, "Improved.", "Acme"))
+
+    def merge():
+        merger = PdfMerger()
+        merger.append(io.BytesIO(summary_bytes))
+        merger.append(io.BytesIO(summary_bytes))
+        out = io.BytesIO()
+        merger.write(out)
+        merger.close()
+    report("PdfMerger merge (2 docs)", args.number, merge)
+
+    if shutil.which("xelatex"):
+        latex = fake_gemini.sample_latex()
+        app.pdf_cache.max_entries = 0
+        report("compile_latex_to_pdf", 3, lambda: app.compile_latex_to_pdf(latex))
+    else:
+        print(f"{'compile_latex_to_pdf':<28}{'skipped (no xelatex)':>24}")
+
+
+if __name__ == "__main__":
+    main()